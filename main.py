@@ -15,7 +15,7 @@ from utils.logger import logger, setup_logging
 from ui.utils import create_menu_panel
 from ui.course_processor_menu import show_course_processor_menu
 from ui.settings_menu import show_settings_menu
-from services.course_processor_service import process_complete_course
+from services.course_processor_service import process_complete_course, summarize_pending_courses_batch
 
 console = Console()
 
@@ -102,6 +102,15 @@ def main_menu():
             time.sleep(1)
 
 
+def run_pending_summaries() -> int:
+    """Modo não interativo (ex: agendado para a madrugada): resume em lote os cursos pendentes."""
+    setup_logging()
+    logger.info("NeuroDeamon batch summary backfill started.")
+    initialize_database()
+    success, message = summarize_pending_courses_batch()
+    console.print(f"[bright_green]{message}[/]" if success else f"[bright_red]Batch summary error:[/] {message}")
+    return 0 if success else 1
+
 def main():
     """Função principal da aplicação."""
     setup_logging()
@@ -111,4 +120,7 @@ def main():
     main_menu()
 
 if __name__ == "__main__":
+    # python main.py --summarize-pending: resume em lote os cursos com transcrição e sem resumo, sem menus
+    if "--summarize-pending" in sys.argv[1:]:
+        sys.exit(run_pending_summaries())
     main()
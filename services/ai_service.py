@@ -1,78 +1,952 @@
 # services/ai_service.py
 
 import anthropic
+import asyncio
+import openai
 import os
+import random
+import requests
+import threading
+import time
+from abc import ABC, abstractmethod
 from rich.console import Console
 from rich.progress import Progress
-from services.security_service import load_api_keys
+from services.routing_service import ContextOverflowError, estimate_tokens, route_prompt
+from services.client_service import (get_anthropic_client, get_api_key, get_async_anthropic_client, get_async_openai_client,
+                                     get_gemini_base_url, get_gemini_session, get_openai_client, run_async)
+from services.transcript_service import format_lesson_text
+from utils.config import load_settings
+from utils.database import get_db_connection
+from utils.cache_stats import HitCounter
+from utils.hashing import hash_params, hash_text
 from utils.logger import logger
 
 console = Console()
 
 PROMPTS_DIR = os.path.join("prompts", "course_processor")
 
+# Contadores de acerto do cache de respostas na sessão atual
+_llm_cache_stats = HitCounter()
+
+# Templates de prompt já lidos: caminho -> (mtime, texto)
+_prompt_cache = {}
+_prompt_cache_lock = threading.Lock()
+
+# Prompt do map, usado quando prompts/course_processor/summary_map.md não existe
+DEFAULT_MAP_PROMPT = (
+    "The following is one part of a course transcription, split by lesson. "
+    "Write a dense, structured summary of this part: the key concepts, definitions, examples and "
+    "conclusions of each lesson, keeping the lesson titles as headings. Do not add an introduction "
+    "or conclusion. Write in the same language as the transcription.\n\n{{TRANSCRIPTION}}"
+)
+
 def load_prompt(prompt_name: str) -> str:
-    """Carrega um prompt de um arquivo .md."""
+    """Carrega um prompt de um arquivo .md.
+
+    Os templates ficam em cache na memória e só são relidos quando o arquivo muda (mtime).
+    """
     prompt_path = os.path.join(PROMPTS_DIR, f"{prompt_name}.md")
     if not os.path.exists(prompt_path):
         logger.error(f"Prompt file not found: {prompt_path}")
         raise FileNotFoundError(f"Prompt file not found: {prompt_path}")
     try:
+        mtime = os.path.getmtime(prompt_path)
+        with _prompt_cache_lock:
+            cached = _prompt_cache.get(prompt_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
         with open(prompt_path, "r", encoding="utf-8") as f:
-            return f.read()
+            template = f.read()
+        with _prompt_cache_lock:
+            _prompt_cache[prompt_path] = (mtime, template)
+        return template
     except IOError as e:
         logger.error(f"Error reading prompt file {prompt_path}: {e}")
         raise IOError(f"Error reading prompt file {prompt_path}: {e}")
 
-def generate_summary_claude(transcription_text: str, prompt_name: str, progress: Progress = None, task_id = None) -> (bool, str):
-    """Gera um resumo usando a API da Anthropic (Claude)."""
-    keys = load_api_keys()
-    api_key = keys.get("anthropic_api_key")
+def _summary_settings() -> dict:
+    """Configurações de resumo (limites e map-reduce), definidas em settings.json; os modelos vêm de model_routing."""
+    settings = {"max_tokens": 2000, "mode": "auto", "chunk_tokens": 60000,
+                "map_max_tokens": 1500, "max_concurrency": 4, "map_prompt": "summary_map", "stream": True, "stream_timeout": 600.0,
+                "artifacts": [], "artifacts_concurrency": 3}
+    settings.update(load_settings().get("summary", {}))
+    return settings
 
+def _get_anthropic_api_key() -> str:
+    """Retorna a chave da Anthropic configurada, ou None se não estiver definida."""
+    api_key = get_api_key("anthropic_api_key")
     if not api_key or api_key == "your-key-here":
         logger.warning("Anthropic API key not set or is default. Skipping summary generation.")
-        return False, "Anthropic API key not set. Please configure it in settings."
+        return None
+    return api_key
+
+def _summary_error_message(error: Exception) -> str:
+    """Registra no log e traduz um erro de geração de resumo para a mensagem exibida ao usuário."""
+    if isinstance(error, ContextOverflowError):
+        logger.error(f"Summary input too large: {error}")
+        return str(error)
+    # Antes do IOError: requests.RequestException é subclasse de IOError
+    if isinstance(error, (openai.APIError, requests.RequestException)):
+        logger.error(f"LLM provider error: {error}")
+        return f"LLM provider error: {error}"
+    if isinstance(error, FileNotFoundError):
+        logger.error(f"Prompt file not found for summary generation: {error}")
+        return str(error)
+    if isinstance(error, IOError):
+        logger.error(f"Error reading prompt file for summary generation: {error}")
+        return str(error)
+    if isinstance(error, anthropic.AuthenticationError):
+        logger.error("Anthropic Authentication failed. Check your API key.")
+        return "Anthropic Authentication failed. Check your API key."
+    if isinstance(error, anthropic.APIConnectionError):
+        logger.error(f"Anthropic API connection error: {error}")
+        return f"Anthropic API connection error: {error}"
+    if isinstance(error, anthropic.RateLimitError):
+        logger.error("Anthropic API rate limit exceeded.")
+        return "Anthropic API rate limit exceeded. Please wait and try again."
+    logger.error(f"An unexpected error occurred during summary generation: {error}")
+    return f"An unexpected error occurred during summary generation: {error}"
+
+def _llm_cache_settings() -> dict:
+    """Configurações do cache de respostas de LLM (seção llm_cache de settings.json)."""
+    settings = {"enabled": True, "ttl_days": 30, "max_entries": 2000}
+    settings.update(load_settings().get("llm_cache", {}))
+    return settings
+
+def llm_cache_key(template: str, input_text: str, model: str, params: dict) -> str:
+    """Chave do cache: hash do template do prompt, da entrada, do modelo e dos parâmetros da requisição."""
+    return hash_params({"template": hash_text(template), "input": hash_text(input_text), "model": model, "params": params})
+
+def _get_cached_entry(cache_keys: list):
+    """Consulta o cache por uma ou mais chaves, em ordem de preferência, ignorando entradas mais antigas que o TTL.
+
+    Todas as chaves vão em uma única consulta, e a busca conta um acerto ou uma falha nas
+    estatísticas da sessão. Retorna a linha (cache_key, model, response_text) ou None se ausente.
+    """
+    cache_settings = _llm_cache_settings()
+    if not cache_settings["enabled"] or not cache_keys:
+        return None
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT cache_key, model, response_text FROM llm_cache WHERE cache_key IN ({', '.join('?' * len(cache_keys))}) "
+        "AND created_at >= datetime('now', ?)",
+        (*cache_keys, f"-{cache_settings['ttl_days']} days")
+    )
+    found = {row['cache_key']: row for row in cursor.fetchall()}
+    entry = next((found[cache_key] for cache_key in cache_keys if cache_key in found), None)
+    if entry is not None:
+        cursor.execute("UPDATE llm_cache SET hit_count = hit_count + 1, last_used_at = CURRENT_TIMESTAMP WHERE cache_key = ?", (entry['cache_key'],))
+        conn.commit()
+    conn.close()
+
+    _llm_cache_stats.record(entry is not None)
+    return entry
+
+def _get_cached_response(cache_key: str) -> str:
+    """Consulta o cache de respostas por uma chave; retorna None se ausente."""
+    entry = _get_cached_entry([cache_key])
+    return entry['response_text'] if entry is not None else None
+
+def _store_response(cache_key: str, model: str, response_text: str):
+    """Grava uma resposta no cache e aplica a expiração (TTL) e o limite de entradas (menos usadas primeiro)."""
+    cache_settings = _llm_cache_settings()
+    if not cache_settings["enabled"]:
+        return
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT OR REPLACE INTO llm_cache (cache_key, model, response_text, size_bytes) VALUES (?, ?, ?, ?)",
+        (cache_key, model, response_text, len(response_text.encode("utf-8")))
+    )
+    cursor.execute("DELETE FROM llm_cache WHERE created_at < datetime('now', ?)", (f"-{cache_settings['ttl_days']} days",))
+    cursor.execute(
+        "DELETE FROM llm_cache WHERE cache_key IN (SELECT cache_key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+        (cache_settings["max_entries"],)
+    )
+    conn.commit()
+    conn.close()
+
+def clear_llm_cache() -> int:
+    """Remove todas as respostas do cache; retorna o número de entradas removidas."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM llm_cache")
+    removed = cursor.rowcount
+    conn.commit()
+    conn.close()
+    logger.info(f"Cleared {removed} LLM cache entries.")
+    return removed
+
+def get_llm_cache_stats() -> dict:
+    """Retorna o tamanho do cache de respostas, os acertos acumulados e a taxa de acerto da sessão atual."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) AS entries, COALESCE(SUM(size_bytes), 0) AS size_bytes, COALESCE(SUM(hit_count), 0) AS total_hits FROM llm_cache")
+    row = cursor.fetchone()
+    conn.close()
+
+    return {"entries": row['entries'], "size_bytes": row['size_bytes'], "total_hits": row['total_hits'], **_llm_cache_stats.snapshot()}
+
+class LLMProvider(ABC):
+    """Interface de um provedor de LLM usado no balanceamento de carga das chamadas de resumo."""
+    name = None
+    key_name = None
+    # Valores de exemplo de config/api_keys.json, que não são chaves de verdade
+    placeholders = ("your-key-here",)
+
+    def is_configured(self) -> bool:
+        api_key = get_api_key(self.key_name)
+        return bool(api_key) and api_key not in self.placeholders
+
+    @abstractmethod
+    def complete(self, model: str, prompt: str, max_tokens: int, timeout: float, max_retries: int) -> str:
+        """Envia o prompt ao modelo e retorna o texto da resposta."""
+
+    async def complete_async(self, model: str, prompt: str, max_tokens: int, timeout: float, max_retries: int) -> str:
+        return await asyncio.to_thread(self.complete, model, prompt, max_tokens, timeout, max_retries)
+
+    def should_fail_over(self, error: Exception) -> bool:
+        """Indica se o erro é passageiro (429, sobrecarga, timeout ou conexão) e a chamada deve ir para outro provedor."""
+        return False
+
+    def is_auth_error(self, error: Exception) -> bool:
+        """Indica se o provedor recusou a chave (401/403); a chamada também segue para outro provedor."""
+        return False
+
+class AnthropicProvider(LLMProvider):
+    name = "anthropic"
+    key_name = "anthropic_api_key"
+
+    def complete(self, model: str, prompt: str, max_tokens: int, timeout: float, max_retries: int) -> str:
+        client = get_anthropic_client().with_options(timeout=timeout, max_retries=max_retries)
+        message = client.messages.create(model=model, max_tokens=max_tokens, messages=[{"role": "user", "content": prompt}])
+        return message.content[0].text
+
+    async def complete_async(self, model: str, prompt: str, max_tokens: int, timeout: float, max_retries: int) -> str:
+        client = get_async_anthropic_client().with_options(timeout=timeout, max_retries=max_retries)
+        message = await client.messages.create(model=model, max_tokens=max_tokens, messages=[{"role": "user", "content": prompt}])
+        return message.content[0].text
+
+    def should_fail_over(self, error: Exception) -> bool:
+        if isinstance(error, anthropic.APIStatusError):
+            return error.status_code == 429 or error.status_code >= 500
+        return isinstance(error, anthropic.APIConnectionError)
+
+    def is_auth_error(self, error: Exception) -> bool:
+        return isinstance(error, (anthropic.AuthenticationError, anthropic.PermissionDeniedError))
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+    key_name = "openai_api_key"
+    placeholders = ("sk-your-key-here", "your-key-here")
+
+    def complete(self, model: str, prompt: str, max_tokens: int, timeout: float, max_retries: int) -> str:
+        client = get_openai_client().with_options(timeout=timeout, max_retries=max_retries)
+        response = client.chat.completions.create(model=model, max_tokens=max_tokens, messages=[{"role": "user", "content": prompt}])
+        return response.choices[0].message.content
+
+    async def complete_async(self, model: str, prompt: str, max_tokens: int, timeout: float, max_retries: int) -> str:
+        client = get_async_openai_client().with_options(timeout=timeout, max_retries=max_retries)
+        response = await client.chat.completions.create(model=model, max_tokens=max_tokens, messages=[{"role": "user", "content": prompt}])
+        return response.choices[0].message.content
+
+    def should_fail_over(self, error: Exception) -> bool:
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code == 429 or error.status_code >= 500
+        return isinstance(error, openai.APIConnectionError)
+
+    def is_auth_error(self, error: Exception) -> bool:
+        return isinstance(error, (openai.AuthenticationError, openai.PermissionDeniedError))
+
+class GeminiProvider(LLMProvider):
+    """Gemini pela API REST generateContent; as chamadas assíncronas rodam em threads. Não há novas tentativas locais."""
+    name = "gemini"
+    key_name = "gemini_api_key"
+
+    def complete(self, model: str, prompt: str, max_tokens: int, timeout: float, max_retries: int) -> str:
+        response = get_gemini_session().post(
+            f"{get_gemini_base_url()}/v1beta/models/{model}:generateContent",
+            headers={"x-goog-api-key": get_api_key(self.key_name)},
+            json={"contents": [{"role": "user", "parts": [{"text": prompt}]}], "generationConfig": {"maxOutputTokens": max_tokens}},
+            timeout=timeout,
+        )
+        response.raise_for_status()
+        candidate = response.json()["candidates"][0]
+        return "".join(part.get("text", "") for part in candidate["content"]["parts"])
+
+    def should_fail_over(self, error: Exception) -> bool:
+        if isinstance(error, requests.HTTPError):
+            return error.response is not None and (error.response.status_code == 429 or error.response.status_code >= 500)
+        return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+    def is_auth_error(self, error: Exception) -> bool:
+        return isinstance(error, requests.HTTPError) and error.response is not None and error.response.status_code in (401, 403)
+
+LLM_PROVIDERS = {provider.name: provider for provider in (AnthropicProvider(), OpenAIProvider(), GeminiProvider())}
+
+# Provedores em pausa após um 429/timeout ou resposta lenta: nome -> instante (monotonic) em que voltam
+_provider_cooldowns = {}
+_provider_cooldowns_lock = threading.Lock()
+
+def _provider_settings() -> dict:
+    """Pesos e limites do balanceamento entre provedores (seção llm_providers de settings.json)."""
+    settings = {"weights": {"anthropic": 1.0}, "request_timeout": 120.0, "slow_seconds": 90.0, "cooldown_seconds": 120.0}
+    settings.update(load_settings().get("llm_providers", {}))
+    return settings
+
+def _has_llm_provider() -> bool:
+    """Indica se algum provedor com peso positivo tem chave configurada."""
+    weights = _provider_settings()["weights"]
+    return any(weight > 0 and name in LLM_PROVIDERS and LLM_PROVIDERS[name].is_configured() for name, weight in weights.items())
+
+def _cool_down(provider_name: str, reason: str):
+    seconds = _provider_settings()["cooldown_seconds"]
+    with _provider_cooldowns_lock:
+        _provider_cooldowns[provider_name] = time.monotonic() + seconds
+    logger.warning(f"LLM provider {provider_name} paused for {seconds:.0f}s: {reason}")
+
+def _skip_provider(provider: LLMProvider, error: Exception) -> bool:
+    """Pausa o provedor se o erro permitir seguir para o próximo candidato (erro passageiro ou chave recusada)."""
+    if provider.is_auth_error(error):
+        logger.error(f"LLM provider {provider.name} rejected its API key. Check it in settings.")
+    elif not provider.should_fail_over(error):
+        return False
+    _cool_down(provider.name, f"{error.__class__.__name__}: {error}")
+    return True
+
+def _provider_candidates(task: str, prompt: str, max_tokens: int) -> list:
+    """Ordena os provedores que podem atender a chamada: [(provedor, modelo)].
+
+    A ordem é sorteada pelos pesos configurados, espalhando as chamadas entre os provedores; os
+    que estão em pausa vão para o fim da fila. Provedores sem chave, sem rota para o nível da
+    tarefa ou cujo maior modelo não comporta o prompt ficam de fora. Se nenhum comportar o prompt,
+    levanta ContextOverflowError antes de qualquer requisição.
+    """
+    routed = []
+    overflow = None
+    for name, weight in _provider_settings()["weights"].items():
+        provider = LLM_PROVIDERS.get(name)
+        if weight <= 0 or provider is None or not provider.is_configured():
+            continue
+        try:
+            routed.append((provider, route_prompt(task, prompt, max_tokens, name), weight))
+        except ContextOverflowError as e:
+            overflow = e
+        except ValueError as e:
+            logger.debug(str(e))
+    if not routed:
+        if overflow:
+            raise overflow
+        raise ValueError(f"No LLM provider configured for {task}. Set an API key and a model route for it in settings.")
+
+    candidates = []
+    while routed:
+        picked = random.choices(range(len(routed)), weights=[weight for _, _, weight in routed])[0]
+        provider, model, _ = routed.pop(picked)
+        candidates.append((provider, model))
+    now = time.monotonic()
+    with _provider_cooldowns_lock:
+        paused = {name for name, until in _provider_cooldowns.items() if until > now}
+    candidates.sort(key=lambda candidate: candidate[0].name in paused)
+    return candidates
+
+def _cache_keys(template: str, input_text: str, candidates: list, max_tokens: int) -> dict:
+    return {model: llm_cache_key(template, input_text, model, {"max_tokens": max_tokens}) for _, model in candidates}
+
+def _find_cached(cache_keys: dict) -> str:
+    """Procura no cache uma resposta de qualquer um dos modelos candidatos (na ordem dos candidatos)."""
+    entry = _get_cached_entry(list(cache_keys.values()))
+    if entry is None:
+        return None
+    logger.info(f"LLM cache hit ({entry['model']})")
+    return entry['response_text']
+
+def _after_call(provider: LLMProvider, started: float, slow_seconds: float):
+    elapsed = time.monotonic() - started
+    if elapsed > slow_seconds:
+        _cool_down(provider.name, f"slow response ({elapsed:.0f}s)")
+
+def _complete(template: str, input_text: str, task: str, max_tokens: int) -> str:
+    """Envia o prompt (template com {{TRANSCRIPTION}} substituído) a um LLM, passando antes pelo cache.
+
+    O provedor é sorteado pelos pesos de llm_providers e o modelo vem de route_prompt. Um 429,
+    sobrecarga, timeout (request_timeout), erro de conexão ou chave recusada (401/403) coloca o
+    provedor em pausa e a chamada segue para o próximo; uma resposta mais lenta que slow_seconds
+    só pausa o provedor.
+    """
+    prompt = template.replace("{{TRANSCRIPTION}}", input_text)
+    candidates = _provider_candidates(task, prompt, max_tokens)
+    cache_keys = _cache_keys(template, input_text, candidates, max_tokens)
+    cached_response = _find_cached(cache_keys)
+    if cached_response is not None:
+        return cached_response
+
+    settings = _provider_settings()
+    # Com outro provedor disponível, o failover substitui as novas tentativas do SDK
+    max_retries = 0 if len(candidates) > 1 else 2
+    for position, (provider, model) in enumerate(candidates):
+        started = time.monotonic()
+        try:
+            response_text = provider.complete(model, prompt, max_tokens, settings["request_timeout"], max_retries)
+        except Exception as e:
+            if position == len(candidates) - 1 or not _skip_provider(provider, e):
+                raise
+            continue
+        _after_call(provider, started, settings["slow_seconds"])
+        _store_response(cache_keys[model], model, response_text)
+        return response_text
+
+async def _complete_async(template: str, input_text: str, task: str, max_tokens: int) -> str:
+    """Versão assíncrona de _complete; o acesso ao cache roda em uma thread."""
+    prompt = template.replace("{{TRANSCRIPTION}}", input_text)
+    candidates = _provider_candidates(task, prompt, max_tokens)
+    cache_keys = _cache_keys(template, input_text, candidates, max_tokens)
+    cached_response = await asyncio.to_thread(_find_cached, cache_keys)
+    if cached_response is not None:
+        return cached_response
+
+    settings = _provider_settings()
+    max_retries = 0 if len(candidates) > 1 else 2
+    for position, (provider, model) in enumerate(candidates):
+        started = time.monotonic()
+        try:
+            response_text = await provider.complete_async(model, prompt, max_tokens, settings["request_timeout"], max_retries)
+        except Exception as e:
+            if position == len(candidates) - 1 or not _skip_provider(provider, e):
+                raise
+            continue
+        _after_call(provider, started, settings["slow_seconds"])
+        await asyncio.to_thread(_store_response, cache_keys[model], model, response_text)
+        return response_text
+
+def generate_summary_claude(transcription_text: str, prompt_name: str, progress: Progress = None, task_id = None) -> (bool, str):
+    """Gera um resumo em uma única requisição (Claude ou, pelo balanceamento, OpenAI/Gemini)."""
+    if not _has_llm_provider():
+        return False, "No LLM provider API key set. Please configure it in settings."
+
+    settings = _summary_settings()
 
     try:
-        client = anthropic.Anthropic(api_key=api_key, timeout=60.0)
         prompt_template = load_prompt(prompt_name)
-        
-        full_prompt = prompt_template.replace("{{TRANSCRIPTION}}", transcription_text)
 
         if progress and task_id is not None:
-            progress.update(task_id, description=f"Generating summary with Claude using prompt [bright_white]{prompt_name}[/]...")
-
-        message = client.messages.create(
-            model="claude-3-sonnet-20240229", # Usando Sonnet como padrão, pode ser configurável
-            max_tokens=2000, # Limite de tokens para a resposta
-            messages=[
-                {"role": "user", "content": full_prompt}
-            ]
-        )
+            progress.update(task_id, description=f"Generating summary using prompt [bright_white]{prompt_name}[/]...")
+
+        # Limite de tokens para a resposta em settings.json; respostas repetidas vêm do cache
+        summary_text = _complete(prompt_template, transcription_text, "summary", settings["max_tokens"])
         
         if progress and task_id is not None:
             progress.update(task_id, advance=100) # Completa a tarefa
 
-        logger.info(f"Summary generated with Claude using prompt {prompt_name}")
-        return True, message.content[0].text
-    except FileNotFoundError as e:
-        logger.error(f"Prompt file not found for summary generation: {e}")
-        return False, str(e)
-    except IOError as e:
-        logger.error(f"Error reading prompt file for summary generation: {e}")
-        return False, str(e)
-    except anthropic.AuthenticationError:
-        logger.error("Anthropic Authentication failed. Check your API key.")
-        return False, "Anthropic Authentication failed. Check your API key."
-    except anthropic.APIConnectionError as e:
-        logger.error(f"Anthropic API connection error: {e}")
-        return False, f"Anthropic API connection error: {e}"
-    except anthropic.RateLimitError:
-        logger.error("Anthropic API rate limit exceeded.")
-        return False, "Anthropic API rate limit exceeded. Please wait and try again."
+        logger.info(f"Summary generated using prompt {prompt_name}")
+        return True, summary_text
     except Exception as e:
-        logger.error(f"An unexpected error occurred during summary generation: {e}")
-        return False, f"An unexpected error occurred during summary generation: {e}"
+        return False, _summary_error_message(e)
+
+def _split_long_text(text: str, max_chars: int) -> list:
+    """Divide um texto maior que max_chars, preferindo cortar no fim de uma frase."""
+    parts = []
+    while len(text) > max_chars:
+        cut = text.rfind(". ", max_chars // 2, max_chars)
+        cut = cut + 1 if cut != -1 else max_chars
+        parts.append(text[:cut].strip())
+        text = text[cut:]
+    if text.strip():
+        parts.append(text.strip())
+    return parts
+
+def split_transcript(lessons, chunk_tokens: int) -> list:
+    """Agrupa as aulas [(título, texto)] em trechos de até chunk_tokens, sempre nos limites entre aulas.
+
+    Só uma aula que sozinha passa do limite é dividida (nas frases), em partes numeradas.
+    """
+    max_chars = chunk_tokens * 4
+    chunks = []
+    current = []
+    current_chars = 0
+    for title, text in lessons:
+        sections = [format_lesson_text(title, text)]
+        if len(sections[0]) > max_chars:
+            parts = _split_long_text(text, max_chars - len(title) - 32)
+            sections = [format_lesson_text(f"{title} ({index}/{len(parts)})", part) for index, part in enumerate(parts, start=1)]
+        for section in sections:
+            if current and current_chars + len(section) > max_chars:
+                chunks.append("\n\n".join(current))
+                current, current_chars = [], 0
+            current.append(section)
+            current_chars += len(section) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+async def _map_summaries(chunks: list, map_template: str, settings: dict, semaphore: asyncio.Semaphore, on_done = None) -> list:
+    """Resume os trechos concorrentemente (limitado pelo semáforo), mantendo a ordem."""
+    async def _summarize(chunk: str) -> str:
+        async with semaphore:
+            summary_text = await _complete_async(map_template, chunk, "map", settings["map_max_tokens"])
+        if on_done:
+            on_done()
+        return summary_text
+
+    return await asyncio.gather(*(_summarize(chunk) for chunk in chunks))
+
+async def summarize_chunks_async(lessons, progress: Progress = None, task_id = None) -> (bool, str):
+    """Fase map do resumo: divide a transcrição e resume os trechos em paralelo.
+
+    A transcrição é dividida por orçamento de tokens nos limites entre aulas. Se os resumos parciais
+    ainda não couberem em um trecho, eles são resumidos de novo em grupos. Retorna (True, resumos
+    parciais em um único texto, entrada do reduce) ou (False, mensagem).
+    """
+    if not _has_llm_provider():
+        return False, "No LLM provider API key set. Please configure it in settings."
+
+    settings = _summary_settings()
+    map_task = None
+
+    try:
+        try:
+            map_template = load_prompt(settings["map_prompt"])
+        except FileNotFoundError:
+            map_template = DEFAULT_MAP_PROMPT
+
+        chunks = split_transcript(lessons, settings["chunk_tokens"])
+        semaphore = asyncio.Semaphore(settings["max_concurrency"])
+        logger.info(f"Summarizing transcript in {len(chunks)} chunks (map-reduce)")
+
+        if progress and task_id is not None:
+            map_task = progress.add_task("Summarizing transcript chunks...", total=len(chunks))
+
+        def _on_chunk_done():
+            if map_task is not None:
+                progress.update(map_task, advance=1)
+
+        partials = await _map_summaries(chunks, map_template, settings, semaphore, _on_chunk_done)
+        # Reduz em níveis enquanto os resumos parciais não couberem em um único trecho
+        while len(partials) > 1 and estimate_tokens("\n\n".join(partials)) > settings["chunk_tokens"]:
+            groups = split_transcript(((f"Part {index}", partial) for index, partial in enumerate(partials, start=1)), settings["chunk_tokens"])
+            partials = await _map_summaries(groups, map_template, settings, semaphore)
+
+        if progress and task_id is not None:
+            progress.update(task_id, description=f"Merging {len(chunks)} partial summaries...")
+        return True, "\n\n".join(format_lesson_text(f"Part {index}", partial) for index, partial in enumerate(partials, start=1))
+    except Exception as e:
+        return False, _summary_error_message(e)
+    finally:
+        if map_task is not None:
+            progress.update(map_task, visible=False)
+
+async def generate_summary_map_reduce_async(lessons, prompt_name: str, progress: Progress = None, task_id = None) -> (bool, str):
+    """Resume um curso longo em map-reduce.
+
+    Os trechos da transcrição são resumidos em paralelo (summarize_chunks_async) e os resumos
+    parciais são combinados pelo prompt prompt_name (reduce). A latência acompanha o maior
+    trecho, não a duração total do curso.
+    """
+    try:
+        # Carrega o prompt do reduce antes do map, para falhar cedo se ele não existir
+        reduce_template = load_prompt(prompt_name)
+    except Exception as e:
+        return False, _summary_error_message(e)
+
+    success, merged = await summarize_chunks_async(lessons, progress, task_id)
+    if not success:
+        return False, merged
+
+    settings = _summary_settings()
+    try:
+        summary_text = await _complete_async(reduce_template, merged, "reduce", settings["max_tokens"])
+        logger.info(f"Summary generated (map-reduce) using prompt {prompt_name}")
+        return True, summary_text
+    except Exception as e:
+        return False, _summary_error_message(e)
+
+def _can_stream() -> bool:
+    """O streaming usa a API da Anthropic: só vale se ela estiver configurada, com peso positivo e fora de pausa."""
+    if _provider_settings()["weights"].get("anthropic", 0) <= 0 or not LLM_PROVIDERS["anthropic"].is_configured():
+        return False
+    with _provider_cooldowns_lock:
+        return _provider_cooldowns.get("anthropic", 0) <= time.monotonic()
+
+def _record_llm_metrics(model: str, prompt_name: str, metrics: dict):
+    """Registra as métricas de latência de uma geração em streaming."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO llm_metrics (model, prompt_name, ttft_seconds, elapsed_seconds, output_tokens, tokens_per_second, cancelled) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (model, prompt_name, metrics["ttft"], metrics["elapsed"], metrics["output_tokens"], metrics["tokens_per_second"], int(metrics["cancelled"]))
+    )
+    conn.commit()
+    conn.close()
+
+def generate_summary_claude_stream(transcription_text: str, prompt_name: str, output_path: str, cancel_event: threading.Event = None,
+                                  on_text = None, progress: Progress = None, task_id = None, task: str = "summary") -> (bool, str):
+    """Gera um resumo em streaming, gravando o texto em output_path à medida que chega.
+
+    on_text(trecho) recebe cada trecho de texto, para que etapas seguintes comecem antes do fim.
+    Se cancel_event for sinalizado, a geração para e o texto já produzido permanece no arquivo.
+    O tempo até o primeiro token (TTFT) e os tokens/s de cada chamada são registrados em llm_metrics.
+    task define a rota de modelo ("reduce" quando o texto já são resumos parciais).
+    """
+    api_key = _get_anthropic_api_key()
+    if not api_key:
+        return False, "Anthropic API key not set. Please configure it in settings."
+
+    settings = _summary_settings()
+
+    try:
+        prompt_template = load_prompt(prompt_name)
+        prompt = prompt_template.replace("{{TRANSCRIPTION}}", transcription_text)
+        model = route_prompt(task, prompt, settings["max_tokens"])
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+        cache_key = llm_cache_key(prompt_template, transcription_text, model, {"max_tokens": settings["max_tokens"]})
+        cached_response = _get_cached_response(cache_key)
+        if cached_response is not None:
+            logger.info(f"LLM cache hit ({model})")
+            with open(output_path, "w", encoding="utf-8") as f: f.write(cached_response)
+            if on_text:
+                on_text(cached_response)
+            return True, cached_response
+
+        if progress and task_id is not None:
+            progress.update(task_id, description=f"Streaming summary with Claude using prompt [bright_white]{prompt_name}[/]...")
+
+        client = get_anthropic_client().with_options(timeout=settings["stream_timeout"])
+        parts = []
+        cancelled = False
+        first_token_at = None
+        started = time.monotonic()
+        try:
+            with open(output_path, "w", encoding="utf-8") as f, client.messages.stream(
+                model=model,
+                max_tokens=settings["max_tokens"],
+                messages=[{"role": "user", "content": prompt}]
+            ) as stream:
+                for text in stream.text_stream:
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                    # Cada trecho vai direto para o disco: um cancelamento ou falha não perde o que já foi gerado
+                    f.write(text)
+                    f.flush()
+                    parts.append(text)
+                    if on_text:
+                        on_text(text)
+                    if cancel_event is not None and cancel_event.is_set():
+                        cancelled = True
+                        break
+                output_tokens = None if cancelled else stream.get_final_message().usage.output_tokens
+        except Exception as e:
+            # Antes do primeiro trecho, um 429/sobrecarga ou chave recusada do Claude passa o resumo aos demais provedores (sem streaming)
+            if parts or not _skip_provider(LLM_PROVIDERS["anthropic"], e):
+                raise
+            summary_text = _complete(prompt_template, transcription_text, task, settings["max_tokens"])
+            with open(output_path, "w", encoding="utf-8") as f: f.write(summary_text)
+            if on_text:
+                on_text(summary_text)
+            if progress and task_id is not None:
+                progress.update(task_id, advance=100) # Completa a tarefa
+            return True, summary_text
+
+        summary_text = "".join(parts)
+        finished = time.monotonic()
+        first_token_at = first_token_at or finished
+        # Sem a mensagem final (cancelamento), os tokens gerados são estimados pelo texto
+        output_tokens = output_tokens if output_tokens is not None else estimate_tokens(summary_text)
+        generation_seconds = finished - first_token_at
+        metrics = {
+            "ttft": first_token_at - started,
+            "elapsed": finished - started,
+            "output_tokens": output_tokens,
+            "tokens_per_second": output_tokens / generation_seconds if generation_seconds > 0 else 0.0,
+            "cancelled": cancelled,
+        }
+        _record_llm_metrics(model, prompt_name, metrics)
+        logger.info(f"Summary stream ({prompt_name}): TTFT {metrics['ttft']:.2f}s, {metrics['output_tokens']} tokens "
+                    f"at {metrics['tokens_per_second']:.1f} tokens/s{' (cancelled)' if cancelled else ''}")
+
+        if cancelled:
+            return False, f"Summary generation cancelled; partial summary kept in {output_path}"
+
+        _store_response(cache_key, model, summary_text)
+        if progress and task_id is not None:
+            progress.update(task_id, advance=100) # Completa a tarefa
+        return True, summary_text
+    except Exception as e:
+        return False, _summary_error_message(e)
+
+def generate_course_summary(lessons, prompt_name: str, progress: Progress = None, task_id = None, output_path: str = None,
+                            cancel_event: threading.Event = None, on_text = None) -> (bool, str):
+    """Resume a transcrição de um curso, dada como aulas [(título, texto)].
+
+    No modo "auto" (padrão), transcrições que cabem em um trecho usam uma única requisição e as
+    maiores usam map-reduce; "single" e "map_reduce" forçam um dos caminhos. Com output_path, o
+    resumo é gravado no arquivo; se summary.stream estiver ativo, a resposta final (o reduce, no
+    map-reduce) é gerada em streaming direto para o arquivo e pode ser cancelada por cancel_event.
+    O streaming usa o Claude; com a Anthropic sem chave ou em pausa, a resposta vem dos outros provedores.
+    """
+    settings = _summary_settings()
+    lessons = list(lessons)
+    transcription_text = "\n\n".join(format_lesson_text(title, text) for title, text in lessons)
+    single = settings["mode"] == "single" or (settings["mode"] == "auto" and estimate_tokens(transcription_text) <= settings["chunk_tokens"])
+
+    if output_path and settings["stream"] and _can_stream():
+        if not single:
+            success, transcription_text = run_async(summarize_chunks_async(lessons, progress, task_id))
+            if not success:
+                return False, transcription_text
+        return generate_summary_claude_stream(transcription_text, prompt_name, output_path, cancel_event, on_text, progress, task_id,
+                                              task="summary" if single else "reduce")
+
+    if single:
+        success, summary = generate_summary_claude(transcription_text, prompt_name, progress, task_id)
+    else:
+        success, summary = run_async(generate_summary_map_reduce_async(lessons, prompt_name, progress, task_id))
+        if success and progress and task_id is not None:
+            progress.update(task_id, advance=100) # Completa a tarefa
+
+    if success and output_path:
+        with open(output_path, "w", encoding="utf-8") as f: f.write(summary)
+    return success, summary
+
+async def generate_course_artifacts_async(lessons, prompt_names: list, output_files: dict, progress: Progress = None, task_id = None) -> (bool, dict):
+    """Gera vários artefatos (resumo, notas de estudo, glossário...) a partir da mesma transcrição, em paralelo.
+
+    Os templates são carregados uma única vez, antes de qualquer requisição. Transcrições longas
+    passam pela fase map uma só vez e todos os prompts usam os mesmos resumos parciais. No máximo
+    summary.artifacts_concurrency requisições ficam em voo. output_files mapeia cada prompt para o
+    arquivo de saída. Retorna (True, {prompt: arquivo}) ou (False, mensagem do primeiro erro); os
+    artefatos concluídos são gravados mesmo quando outro falha.
+    """
+    if not _has_llm_provider():
+        return False, "No LLM provider API key set. Please configure it in settings."
+
+    settings = _summary_settings()
+
+    try:
+        templates = {prompt_name: load_prompt(prompt_name) for prompt_name in prompt_names}
+    except Exception as e:
+        return False, _summary_error_message(e)
+
+    lessons = list(lessons)
+    input_text = "\n\n".join(format_lesson_text(title, text) for title, text in lessons)
+    if settings["mode"] == "map_reduce" or (settings["mode"] == "auto" and estimate_tokens(input_text) > settings["chunk_tokens"]):
+        success, input_text = await summarize_chunks_async(lessons, progress, task_id)
+        if not success:
+            return False, input_text
+
+    semaphore = asyncio.Semaphore(settings["artifacts_concurrency"])
+    artifacts_task = None
+    if progress and task_id is not None:
+        artifacts_task = progress.add_task("Generating course artifacts...", total=len(prompt_names))
+
+    async def _generate(prompt_name: str) -> str:
+        async with semaphore:
+            artifact_text = await _complete_async(templates[prompt_name], input_text, "artifact", settings["max_tokens"])
+        output_path = output_files[prompt_name]
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as f: f.write(artifact_text)
+        if artifacts_task is not None:
+            progress.update(artifacts_task, advance=1, description=f"Generated [bright_white]{prompt_name}[/]")
+        logger.info(f"Artifact generated using prompt {prompt_name}: {output_path}")
+        return output_path
+
+    try:
+        results = await asyncio.gather(*(_generate(prompt_name) for prompt_name in prompt_names), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                return False, _summary_error_message(result)
+        return True, dict(zip(prompt_names, results))
+    finally:
+        if artifacts_task is not None:
+            progress.update(artifacts_task, visible=False)
+
+def generate_course_artifacts(lessons, prompt_names: list, output_directory: str, output_files: dict = None,
+                              progress: Progress = None, task_id = None) -> (bool, dict):
+    """Ponto de entrada síncrono de generate_course_artifacts_async.
+
+    Cada artefato vai para <output_directory>/<prompt>.md, salvo os nomes definidos em output_files.
+    """
+    output_files = {prompt_name: os.path.join(output_directory, (output_files or {}).get(prompt_name, f"{prompt_name}.md"))
+                    for prompt_name in prompt_names}
+    success, result = run_async(generate_course_artifacts_async(lessons, prompt_names, output_files, progress, task_id))
+    if success and progress and task_id is not None:
+        progress.update(task_id, advance=100) # Completa a tarefa
+    return success, result
+
+def _batch_settings() -> dict:
+    """Configurações do modo em lote (seção summary.batch de settings.json)."""
+    settings = {"poll_interval": 30, "max_poll_interval": 600, "backoff": 1.5}
+    settings.update(_summary_settings().get("batch") or {})
+    return settings
+
+def create_summary_batch(inputs: dict, prompt_name: str, progress: Progress = None, task_id = None) -> (bool, dict):
+    """Envia vários resumos em um único job da Message Batches API.
+
+    inputs mapeia um custom_id para as aulas [(título, texto)] da transcrição. Transcrições que
+    não cabem na rota "summary" passam antes pela fase map (summarize_chunks_async, fora do lote)
+    e o lote recebe os resumos parciais, como no map-reduce de generate_course_summary. As
+    entradas já presentes no cache de respostas não são enviadas. O ID do lote e o custom_id/chave
+    de cache de cada requisição são gravados no SQLite, para que o resultado possa ser recolhido
+    mesmo após reiniciar o programa. Retorna (True, {"batch_id": ID ou None, "cached": {custom_id:
+    resumo}, "skipped": {custom_id: motivo}}) ou (False, mensagem).
+    """
+    api_key = _get_anthropic_api_key()
+    if not api_key:
+        return False, "Anthropic API key not set. Please configure it in settings."
+
+    settings = _summary_settings()
+
+    try:
+        template = load_prompt(prompt_name)
+        cached = {}
+        skipped = {}
+        batch_requests = []
+        cache_keys = {}
+        models = set()
+        for custom_id, lessons in inputs.items():
+            lessons = list(lessons)
+            input_text = "\n\n".join(format_lesson_text(title, text) for title, text in lessons)
+            prompt = template.replace("{{TRANSCRIPTION}}", input_text)
+            try:
+                # Cada requisição do lote tem sua própria rota
+                model = route_prompt("summary", prompt, settings["max_tokens"])
+            except ContextOverflowError:
+                # Grande demais para uma requisição: o lote recebe os resumos parciais da fase map
+                logger.info(f"{custom_id} exceeds the summary context; running the map phase before batching.")
+                success, input_text = run_async(summarize_chunks_async(lessons, progress, task_id))
+                if not success:
+                    logger.warning(f"Skipping {custom_id} in summary batch: {input_text}")
+                    skipped[custom_id] = input_text
+                    continue
+                prompt = template.replace("{{TRANSCRIPTION}}", input_text)
+                try:
+                    model = route_prompt("reduce", prompt, settings["max_tokens"])
+                except ContextOverflowError as e:
+                    logger.warning(f"Skipping {custom_id} in summary batch: {e}")
+                    skipped[custom_id] = str(e)
+                    continue
+            cache_key = llm_cache_key(template, input_text, model, {"max_tokens": settings["max_tokens"]})
+            cached_response = _get_cached_response(cache_key)
+            if cached_response is not None:
+                cached[custom_id] = cached_response
+                continue
+            cache_keys[custom_id] = cache_key
+            models.add(model)
+            batch_requests.append({
+                "custom_id": custom_id,
+                "params": {
+                    "model": model,
+                    "max_tokens": settings["max_tokens"],
+                    "messages": [{"role": "user", "content": prompt}],
+                },
+            })
+
+        if not batch_requests:
+            return True, {"batch_id": None, "cached": cached, "skipped": skipped}
+
+        batch = get_anthropic_client().messages.batches.create(requests=batch_requests)
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO summary_batches (batch_id, prompt_name, model, status, request_count) VALUES (?, ?, ?, ?, ?)",
+            (batch.id, prompt_name, ",".join(sorted(models)), batch.processing_status, len(batch_requests))
+        )
+        cursor.executemany(
+            "INSERT INTO summary_batch_items (batch_id, custom_id, cache_key) VALUES (?, ?, ?)",
+            [(batch.id, custom_id, cache_key) for custom_id, cache_key in cache_keys.items()]
+        )
+        conn.commit()
+        conn.close()
+
+        logger.info(f"Submitted summary batch {batch.id} with {len(batch_requests)} requests ({len(cached)} answered from cache)")
+        return True, {"batch_id": batch.id, "cached": cached, "skipped": skipped}
+    except Exception as e:
+        return False, _summary_error_message(e)
+
+def _set_batch_status(batch_id: str, status: str):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE summary_batches SET status = ?, completed_at = CASE WHEN ? IN ('ended', 'collected') THEN CURRENT_TIMESTAMP ELSE completed_at END WHERE batch_id = ?",
+        (status, status, batch_id)
+    )
+    conn.commit()
+    conn.close()
+
+def wait_for_summary_batch(batch_id: str, timeout: float = None, progress: Progress = None, task_id = None) -> (bool, str):
+    """Consulta o lote até ele terminar, com intervalo crescente (backoff) entre as consultas.
+
+    Retorna (True, "ended") ou (False, mensagem) em caso de erro ou de timeout (em segundos).
+    """
+    batch_settings = _batch_settings()
+    interval = batch_settings["poll_interval"]
+    started = time.monotonic()
+
+    try:
+        client = get_anthropic_client()
+        while True:
+            batch = client.messages.batches.retrieve(batch_id)
+            _set_batch_status(batch_id, batch.processing_status)
+            if batch.processing_status == "ended":
+                logger.info(f"Summary batch {batch_id} ended.")
+                return True, "ended"
+
+            counts = batch.request_counts
+            if progress and task_id is not None:
+                progress.update(task_id, description=f"Waiting for summary batch [bright_white]{batch_id}[/] "
+                                                     f"({counts.succeeded + counts.errored} done, {counts.processing} processing)...")
+            if timeout is not None and time.monotonic() - started + interval > timeout:
+                return False, f"Timed out waiting for summary batch {batch_id}."
+            time.sleep(interval)
+            interval = min(interval * batch_settings["backoff"], batch_settings["max_poll_interval"])
+    except Exception as e:
+        return False, _summary_error_message(e)
+
+def collect_summary_batch(batch_id: str) -> (bool, dict):
+    """Lê os resultados de um lote encerrado, grava cada resumo no cache de respostas e retorna {custom_id: resumo}.
+
+    Requisições com erro, canceladas ou expiradas são registradas no log e ficam fora do resultado.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT model FROM summary_batches WHERE batch_id = ?", (batch_id,))
+    batch_row = cursor.fetchone()
+    cursor.execute("SELECT custom_id, cache_key FROM summary_batch_items WHERE batch_id = ?", (batch_id,))
+    cache_keys = {row['custom_id']: row['cache_key'] for row in cursor.fetchall()}
+    conn.close()
+    if batch_row is None:
+        return False, f"Unknown summary batch: {batch_id}"
+
+    try:
+        summaries = {}
+        # Os resultados chegam em streaming (JSONL), um por requisição
+        for entry in get_anthropic_client().messages.batches.results(batch_id):
+            if entry.result.type != "succeeded":
+                logger.error(f"Summary batch {batch_id} request {entry.custom_id} {entry.result.type}.")
+                continue
+            summary_text = entry.result.message.content[0].text
+            summaries[entry.custom_id] = summary_text
+            if entry.custom_id in cache_keys:
+                _store_response(cache_keys[entry.custom_id], entry.result.message.model, summary_text)
+
+        _set_batch_status(batch_id, "collected")
+        logger.info(f"Collected {len(summaries)} summaries from batch {batch_id}")
+        return True, summaries
+    except Exception as e:
+        return False, _summary_error_message(e)
+
+def list_open_summary_batches() -> list:
+    """Retorna os IDs dos lotes enviados cujos resultados ainda não foram recolhidos."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT batch_id FROM summary_batches WHERE status != 'collected' ORDER BY created_at")
+    batch_ids = [row['batch_id'] for row in cursor.fetchall()]
+    conn.close()
+    return batch_ids
 
 # Exemplo de uso (para testes)
 if __name__ == "__main__":
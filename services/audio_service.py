@@ -1,75 +1,161 @@
 # services/audio_service.py
 
 import os
-from pydub import AudioSegment
+import tempfile
 from rich.console import Console
 from rich.progress import Progress
+from services.probe_service import format_duration, get_duration, probe_media
+from services.video_service import ENCODE_PARAMS, run_ffmpeg_with_progress
+from utils.id3 import estimate_chapter_tag_size, write_chapters
+from utils.logger import logger
 
 console = Console()
 
-def create_unified_audio(audio_files: list[str], output_path: str, progress: Progress = None, task_id = None) -> (bool, str):
-    """Unifica múltiplos arquivos de áudio em um único MP3."""
+def _write_concat_list(audio_files: list[str]) -> str:
+    """Escreve a lista de entrada do concat demuxer do ffmpeg e retorna seu caminho."""
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as list_file:
+        for file_path in audio_files:
+            # O concat demuxer usa aspas simples; apóstrofos no caminho precisam de escape
+            escaped_path = os.path.abspath(file_path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped_path}'\n")
+        return list_file.name
+
+def _can_frame_copy(audio_files: list[str]) -> bool:
+    """Verifica se todas as entradas são MP3 com os mesmos parâmetros, permitindo concatenar sem recodificar."""
+    signatures = set()
+    for file_path in audio_files:
+        info = probe_media(file_path)
+        if not info or info["codec"] != "mp3":
+            return False
+        signatures.add((info["sample_rate"], info["channels"]))
+    return len(signatures) == 1
+
+def create_unified_audio(audio_files: list[str], output_path: str, progress: Progress = None, task_id = None, embed_chapters: bool = True) -> (bool, str):
+    """Unifica múltiplos arquivos de áudio em um único MP3.
+
+    Usa o concat demuxer do ffmpeg em streaming: copia os frames quando todas as entradas
+    compartilham os parâmetros de codificação, e recodifica em streaming caso contrário.
+    O uso de memória é constante, independente da duração do curso. Com embed_chapters, cada
+    aula vira um capítulo ID3 (CHAP/CTOC) gravado no espaço reservado do cabeçalho.
+    """
     if not audio_files:
         return False, "No audio files provided for unification."
 
-    combined_audio = AudioSegment.empty()
-    
+    for file_path in audio_files:
+        if not os.path.exists(file_path):
+            return False, f"Audio file not found: {file_path}"
+
+    unify_task = None
     if progress and task_id is not None:
-        progress.update(task_id, description="Initializing audio unification...")
+        unify_task = progress.add_task("Initializing audio unification...", total=100)
 
+    list_path = None
     try:
-        for i, file_path in enumerate(audio_files):
-            if not os.path.exists(file_path):
-                return False, f"Audio file not found: {file_path}"
-            
-            if progress and task_id is not None:
-                progress.update(task_id, description=f"Adding [bright_white]{os.path.basename(file_path)}[/] to unified audio...")
-                progress.update(task_id, advance=100 / len(audio_files))
-
-            audio = AudioSegment.from_file(file_path)
-            combined_audio += audio
+        frame_copy = _can_frame_copy(audio_files)
+        total_duration = sum(get_duration(file_path) for file_path in audio_files)
+        list_path = _write_concat_list(audio_files)
+
+        command = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-map", "0:a", "-vn"]
+        if frame_copy:
+            command += ["-c:a", "copy"]
+        else:
+            command += ["-ar", str(ENCODE_PARAMS["sample_rate"]), "-acodec", ENCODE_PARAMS["codec"], "-b:a", ENCODE_PARAMS["bitrate"]]
+
+        chapters = build_lesson_chapters(audio_files) if embed_chapters and output_path.lower().endswith(".mp3") else []
+        toc_title = lesson_title(output_path)
+        if chapters:
+            # Reserva padding no tag ID3 para gravar os capítulos depois sem reescrever o áudio
+            command += ["-id3v2_version", "3", "-metadata_header_padding", str(estimate_chapter_tag_size(chapters, toc_title))]
+        command.append(output_path)
 
         # Cria o diretório de saída se não existir
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
 
-        if progress and task_id is not None:
-            progress.update(task_id, description=f"Exporting unified audio to [bright_white]{os.path.basename(output_path)}[/]...")
+        mode = "frame copy" if frame_copy else "streaming re-encode"
+        logger.info(f"Unifying {len(audio_files)} audio files ({mode}) into {output_path}")
 
-        combined_audio.export(output_path, format="mp3")
-        
-        if progress and task_id is not None:
-            progress.update(task_id, completed=100, description="Unified audio exported.")
+        def _on_progress(stats: dict):
+            if unify_task is not None:
+                progress.update(unify_task, completed=stats["percent"],
+                                description=f"Unifying audio ({mode}) [bright_white]{stats['speed']:.1f}x[/]")
+
+        success, result = run_ffmpeg_with_progress(command, total_duration, _on_progress)
+        if not success:
+            return False, f"Error unifying audio files: {result}"
+
+        if chapters:
+            write_chapters(output_path, chapters, toc_title)
+            logger.info(f"Embedded {len(chapters)} ID3 chapters into {output_path}")
+
+        if unify_task is not None:
+            progress.update(unify_task, completed=100, description="Unified audio exported.", visible=False)
 
         console.print(f"[bright_green]✓ Unified audio saved to: {output_path}[/]")
         return True, output_path
+    except FileNotFoundError:
+        return False, "ffmpeg not found. Please install ffmpeg and add it to your PATH."
     except Exception as e:
         return False, f"Error unifying audio files: {e}"
+    finally:
+        if list_path and os.path.exists(list_path):
+            os.remove(list_path)
+
+def lesson_title(file_path: str) -> str:
+    """Deriva o título de uma aula a partir do nome do arquivo."""
+    return os.path.splitext(os.path.basename(file_path))[0].replace("_", " ").strip()
+
+def build_lesson_chapters(audio_files: list[str]) -> list[dict]:
+    """Calcula os capítulos (início, fim e título) de cada aula no áudio unificado.
+
+    As durações vêm do cache de probe, então nenhum áudio é decodificado.
+    """
+    chapters = []
+    current_seconds = 0.0
+    for file_path in audio_files:
+        duration = get_duration(file_path)
+        chapters.append({"start": current_seconds, "end": current_seconds + duration, "title": lesson_title(file_path)})
+        current_seconds += duration
+    return chapters
+
+def generate_lesson_timestamps(audio_files: list[str], progress: Progress = None, task_id = None) -> (bool, str):
+    """Gera um timestamp (HH:MM:SS) por aula, acumulando as durações de cada arquivo."""
+    if not audio_files:
+        return False, "No audio files provided for timestamps."
+
+    for file_path in audio_files:
+        if not os.path.exists(file_path):
+            return False, f"Audio file not found: {file_path}"
+
+    try:
+        if progress and task_id is not None:
+            progress.update(task_id, description="Generating lesson timestamps...")
+
+        chapters = build_lesson_chapters(audio_files)
+        timestamps_str = "\n".join(f"{format_duration(chapter['start'])} {chapter['title']}" for chapter in chapters)
+
+        console.print(f"[bright_green]✓ Timestamps generated for {len(chapters)} lessons[/]")
+        return True, timestamps_str
+    except Exception as e:
+        return False, f"Error generating timestamps: {e}"
 
 def generate_timestamps(audio_path: str, interval_minutes: int = 5, progress: Progress = None, task_id = None) -> (bool, str):
-    """Gera timestamps para um arquivo de áudio em intervalos fixos."""
+    """Gera timestamps (HH:MM:SS) para um arquivo de áudio em intervalos fixos."""
     if not os.path.exists(audio_path):
         return False, f"Audio file not found: {audio_path}"
 
     try:
-        audio = AudioSegment.from_file(audio_path)
-        total_milliseconds = len(audio)
-        timestamps = []
-        
+        # A duração vem do cache de probe: nenhuma decodificação do áudio
+        total_seconds = get_duration(audio_path)
+        if not total_seconds:
+            return False, f"Could not determine the duration of {audio_path}"
+
         if progress and task_id is not None:
             progress.update(task_id, description=f"Generating timestamps for [bright_white]{os.path.basename(audio_path)}[/]...")
 
-        current_ms = 0
-        while current_ms < total_milliseconds:
-            minutes = int((current_ms / (1000 * 60)) % 60)
-            seconds = int((current_ms / 1000) % 60)
-            timestamps.append(f"{minutes:02d}:{seconds:02d}")
-            current_ms += interval_minutes * 60 * 1000
-
+        interval_seconds = interval_minutes * 60
+        timestamps = [format_duration(seconds) for seconds in range(0, int(total_seconds), interval_seconds)]
         timestamps_str = "\n".join(timestamps)
 
-        if progress and task_id is not None:
-            progress.update(task_id, completed=100, description="Timestamps generated.")
-
         console.print(f"[bright_green]✓ Timestamps generated for {os.path.basename(audio_path)}[/]")
         return True, timestamps_str
     except Exception as e:
@@ -78,16 +164,14 @@ def generate_timestamps(audio_path: str, interval_minutes: int = 5, progress: Pr
 # Exemplo de uso (para testes)
 if __name__ == "__main__":
     # Crie alguns arquivos de áudio dummy para testar
-    # Requer ffmpeg instalado e no PATH para pydub funcionar
+    # Requer ffmpeg e ffprobe instalados e no PATH
     dummy_audio_dir = "./dummy_audios"
     os.makedirs(dummy_audio_dir, exist_ok=True)
 
     # Criar arquivos de áudio dummy (pode ser mp3, wav, etc.)
     # Para um teste real, você precisaria de arquivos de áudio válidos
-    # from pydub.generators import Sine
-    # sine_wave = Sine(440).to_audio_segment(duration=1000)
-    # sine_wave.export(os.path.join(dummy_audio_dir, "audio1.mp3"), format="mp3")
-    # sine_wave.export(os.path.join(dummy_audio_dir, "audio2.mp3"), format="mp3")
+    # ffmpeg -f lavfi -i sine=frequency=440:duration=1 dummy_audios/audio1.mp3
+    # ffmpeg -f lavfi -i sine=frequency=440:duration=1 dummy_audios/audio2.mp3
 
     # Para este exemplo, vamos apenas simular os caminhos
     audio_files_to_unify = [
@@ -106,9 +190,7 @@ if __name__ == "__main__":
     # Teste de geração de timestamps
     dummy_long_audio = "./long_audio.mp3"
     # Crie um arquivo de áudio longo para testar
-    # from pydub.generators import Sine
-    # long_sine_wave = Sine(440).to_audio_segment(duration=300000) # 5 minutos
-    # long_sine_wave.export(dummy_long_audio, format="mp3")
+    # ffmpeg -f lavfi -i sine=frequency=440:duration=300 long_audio.mp3  # 5 minutos
 
     logger.info(f"Starting timestamp generation...")
     success, timestamps = generate_timestamps(dummy_long_audio, interval_minutes=1)
@@ -0,0 +1,146 @@
+# services/client_service.py
+
+import asyncio
+import threading
+import weakref
+import anthropic
+import httpx
+import openai
+import requests
+from services.security_service import get_api_keys_version, load_api_keys
+from utils.config import load_settings
+from utils.logger import logger
+
+# Registro de clientes de API compartilhados pelo processo. Os clientes síncronos são únicos;
+# os assíncronos são um por event loop, pois o pool de conexões do httpx pertence ao loop que o criou.
+_lock = threading.Lock()
+_keys = None
+_keys_version = None
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()
+
+def _pool_limits() -> httpx.Limits:
+    """Limites do pool de conexões keep-alive, definidos na seção http_pool de settings.json."""
+    settings = {"max_connections": 32, "max_keepalive_connections": 32, "keepalive_expiry": 60.0}
+    settings.update(load_settings().get("http_pool", {}))
+    return httpx.Limits(max_connections=settings["max_connections"],
+                        max_keepalive_connections=settings["max_keepalive_connections"],
+                        keepalive_expiry=settings["keepalive_expiry"])
+
+def _load_keys():
+    """Carrega as chaves, descartando os clientes em cache se elas foram salvas desde a última leitura. Requer _lock."""
+    global _keys, _keys_version
+    version = get_api_keys_version()
+    if _keys is not None and _keys_version == version:
+        return
+    if _keys_version is not None and _keys_version != version:
+        logger.info("API keys changed; rebuilding API clients.")
+        # Os clientes antigos não são fechados: requisições em andamento terminam com eles
+        _clients.clear()
+        _async_clients.clear()
+    _keys = load_api_keys()
+    _keys_version = version
+
+def get_api_key(name: str) -> str:
+    """Retorna uma chave de API; o arquivo de chaves é lido e descriptografado uma única vez."""
+    with _lock:
+        _load_keys()
+        return _keys.get(name)
+
+def get_base_url(provider: str) -> str:
+    """URL base da API de um provedor (seção api_base_urls de settings.json), ou None para o endpoint oficial.
+
+    Permite apontar os clientes para um servidor local de testes.
+    """
+    return (load_settings().get("api_base_urls") or {}).get(provider)
+
+# O Gemini é acessado pela API REST, sem SDK
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com"
+
+def _build_client(provider: str, asynchronous: bool):
+    """Cria o cliente do SDK de um provedor (ou a sessão HTTP, para o Gemini) com um pool de conexões próprio."""
+    # Os clientes HTTP padrão dos SDKs mantêm seus timeouts e TCP keep-alive; só o pool é ajustado
+    limits = _pool_limits()
+    base_url = get_base_url(provider)
+    if provider == "openai":
+        client_class = openai.AsyncOpenAI if asynchronous else openai.OpenAI
+        http_client = openai.DefaultAsyncHttpxClient(limits=limits) if asynchronous else openai.DefaultHttpxClient(limits=limits)
+        return client_class(api_key=_keys.get("openai_api_key"), base_url=base_url, http_client=http_client)
+    if provider == "anthropic":
+        client_class = anthropic.AsyncAnthropic if asynchronous else anthropic.Anthropic
+        http_client = anthropic.DefaultAsyncHttpxClient(limits=limits) if asynchronous else anthropic.DefaultHttpxClient(limits=limits)
+        return client_class(api_key=_keys.get("anthropic_api_key"), base_url=base_url, http_client=http_client)
+    if provider == "gemini":
+        # Sessão requests compartilhada entre threads; a chave vai em cada requisição
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=limits.max_keepalive_connections, pool_maxsize=limits.max_connections)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    raise ValueError(f"Unknown API provider: {provider}")
+
+def _get_client(provider: str):
+    with _lock:
+        _load_keys()
+        if provider not in _clients:
+            _clients[provider] = _build_client(provider, asynchronous=False)
+        return _clients[provider]
+
+def _get_async_client(provider: str):
+    loop = asyncio.get_running_loop()
+    with _lock:
+        _load_keys()
+        loop_clients = _async_clients.setdefault(loop, {})
+        if provider not in loop_clients:
+            loop_clients[provider] = _build_client(provider, asynchronous=True)
+        return loop_clients[provider]
+
+def get_openai_client() -> openai.OpenAI:
+    """Cliente OpenAI compartilhado (use with_options para ajustar timeout por chamada)."""
+    return _get_client("openai")
+
+def get_anthropic_client() -> anthropic.Anthropic:
+    """Cliente Anthropic compartilhado (use with_options para ajustar timeout por chamada)."""
+    return _get_client("anthropic")
+
+def get_gemini_session() -> requests.Session:
+    """Sessão HTTP compartilhada para a API REST do Gemini (as chamadas assíncronas a usam em threads)."""
+    return _get_client("gemini")
+
+def get_gemini_base_url() -> str:
+    return (get_base_url("gemini") or GEMINI_BASE_URL).rstrip("/")
+
+def get_async_openai_client() -> openai.AsyncOpenAI:
+    """Cliente OpenAI assíncrono compartilhado dentro do event loop atual."""
+    return _get_async_client("openai")
+
+def get_async_anthropic_client() -> anthropic.AsyncAnthropic:
+    """Cliente Anthropic assíncrono compartilhado dentro do event loop atual."""
+    return _get_async_client("anthropic")
+
+async def close_async_clients():
+    """Fecha os clientes assíncronos do event loop atual (antes de o loop terminar)."""
+    with _lock:
+        loop_clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in loop_clients.values():
+        await client.close()
+
+def run_async(coroutine):
+    """Executa uma corrotina em um novo event loop (como asyncio.run), fechando ao final os clientes criados nele."""
+    async def _run():
+        try:
+            return await coroutine
+        finally:
+            await close_async_clients()
+    return asyncio.run(_run())
+
+def reset_clients():
+    """Fecha e descarta todos os clientes e chaves em cache; serão recriados no próximo uso."""
+    global _keys, _keys_version
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        _async_clients.clear()
+        _keys = None
+        _keys_version = None
@@ -2,19 +2,24 @@
 
 import os
 import json
+from datetime import datetime
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn
 
 from utils.database import get_db_connection
 from utils.logger import logger
+from services.discovery_service import discover_course
 from services.video_service import process_course_videos_to_audio
-from services.transcription_service import transcribe_audio
-from services.ai_service import generate_summary_claude
-from services.audio_service import create_unified_audio, generate_timestamps
+from services.transcription_service import transcribe_lessons
+from services.transcript_service import append_lesson, iter_lesson_texts, start_transcript, write_transcript_text
+from services.ai_service import collect_summary_batch, create_summary_batch, generate_course_artifacts, generate_course_summary, list_open_summary_batches, wait_for_summary_batch
+from services.audio_service import create_unified_audio, generate_lesson_timestamps, generate_timestamps, lesson_title
 from services.tts_service import generate_tts_audio
 from services.gdrive_service import upload_file_to_drive
 from services.rss_service import update_rss_feed
 from services.github_service import update_github_repo
+from services.probe_service import get_duration, format_duration
+from utils.config import get_setting
 
 console = Console()
 
@@ -48,6 +53,14 @@ def _update_course_status(course_id: int, status: str, stage: str = None, metada
     conn.close()
     logger.info(f"Course {course_id} status updated to {status} at stage {stage if stage else 'N/A'}.")
 
+def _set_course_total_videos(course_id: int, total_videos: int):
+    """Atualiza o total de vídeos descobertos de um curso no DB."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE courses SET total_videos = ? WHERE id = ?", (total_videos, course_id))
+    conn.commit()
+    conn.close()
+
 def _log_operation(course_id: int, op_type: str, status: str, error_msg: str = None, details: dict = None):
     """Registra uma operação no DB."""
     conn = get_db_connection()
@@ -76,12 +89,18 @@ def process_complete_course(course_name: str, course_directory: str, output_base
     conn.commit()
     conn.close()
 
-    course_metadata = {"audio_files": [], "transcription": None, "summary": None, "unified_audio": None, "timestamps": None, "gdrive_id": None}
+    course_output_directory = os.path.join(output_base_directory, course_name)
+    cover_directory = os.path.join(course_output_directory, "covers") if get_setting("video_conversion", "cover_frame", False) else None
+
+    course_metadata = {"output_directory": course_output_directory, "audio_files": [], "transcription_audio_files": [], "cover": None, "transcript": None, "transcription": None, "summary": None, "unified_audio": None, "timestamps": None, "gdrive_id": None}
+
+    lessons = []
 
     steps = [
-        {"name": "Video to Audio Conversion", "func": process_course_videos_to_audio, "args": (course_directory, os.path.join(output_base_directory, course_name, "audios")), "stage": "converting_audio"},
-        {"name": "Audio Transcription", "func": transcribe_audio, "args": (None,), "stage": "transcribing"}, # Audio path will be dynamic
-        {"name": "AI Summary Generation", "func": generate_summary_claude, "args": (None, "summary_test"), "stage": "summarizing"}, # Transcription and prompt dynamic
+        {"name": "Course Discovery", "func": discover_course, "args": (course_directory,), "stage": "discovery"},
+        {"name": "Video to Audio Conversion", "func": process_course_videos_to_audio, "args": (course_directory, os.path.join(course_output_directory, "audios")), "stage": "converting_audio"},
+        {"name": "Audio Transcription", "func": transcribe_lessons, "args": (None,), "stage": "transcribing"}, # Audio paths dynamic
+        {"name": "AI Summary Generation", "func": generate_course_summary, "args": (None, "summary_test"), "stage": "summarizing"}, # Transcription and prompt dynamic
         {"name": "Audio Unification", "func": create_unified_audio, "args": (None, os.path.join(output_base_directory, course_name, f"{course_name}.mp3")), "stage": "unifying_audio"},
         {"name": "Timestamp Generation", "func": generate_timestamps, "args": (None,), "stage": "generating_timestamps"}, # Audio path dynamic
         {"name": "Google Drive Upload", "func": upload_file_to_drive, "args": (None,), "stage": "uploading_gdrive"}, # File path dynamic
@@ -99,36 +118,71 @@ def process_complete_course(course_name: str, course_directory: str, output_base
             success = False
             message = ""
 
-            if step['name'] == "Video to Audio Conversion":
-                success, message = step['func'](*step['args'], progress=overall_progress, task_id=overall_task)
+            if step['name'] == "Course Discovery":
+                # Uma única varredura da árvore; as etapas seguintes iteram sobre este índice
+                lessons = step['func'](*step['args'])
+                if lessons:
+                    _set_course_total_videos(course_id, len(lessons))
+                    success, message = True, f"{len(lessons)} lessons discovered."
+                else:
+                    success, message = False, f"No videos found in {course_directory}"
+
+            elif step['name'] == "Video to Audio Conversion":
+                # Uma única passada do ffmpeg gera o MP3 do podcast, o áudio para transcrição e a capa
+                success, result = step['func'](*step['args'],
+                                               transcription_directory=os.path.join(course_output_directory, "transcription_audio"),
+                                               cover_directory=cover_directory,
+                                               lessons=lessons,
+                                               progress=overall_progress, task_id=overall_task)
                 if success:
-                    # Aqui, precisaríamos de uma forma de obter os caminhos dos áudios gerados
-                    # Por enquanto, vamos simular que eles estão em output_base_directory/course_name/audios
-                    audio_output_dir = os.path.join(output_base_directory, course_name, "audios")
-                    course_metadata["audio_files"] = [os.path.join(audio_output_dir, f) for f in os.listdir(audio_output_dir) if f.endswith(".mp3")]
+                    course_metadata["audio_files"] = [lesson["audio"] for lesson in result]
+                    course_metadata["transcription_audio_files"] = [lesson["transcription_audio"] or lesson["audio"] for lesson in result]
+                    course_metadata["cover"] = next((lesson["cover"] for lesson in result if lesson["cover"]), None)
+                    message = f"{len(result)} audio files generated."
+                else:
+                    message = result
 
             elif step['name'] == "Audio Transcription":
-                if course_metadata["audio_files"]:
-                    # Transcreve o primeiro áudio para simplificar, ou todos e concatena
-                    success, transcription_text = transcribe_audio(course_metadata["audio_files"][0], progress=overall_progress, task_id=overall_task)
-                    if success:
-                        course_metadata["transcription"] = transcription_text
-                        # Salvar transcrição em arquivo
-                        transcription_file = os.path.join(output_base_directory, course_name, "transcription.txt")
-                        with open(transcription_file, "w", encoding="utf-8") as f: f.write(transcription_text)
+                if course_metadata["transcription_audio_files"]:
+                    # Os segmentos de cada aula vão para o JSONL assim que ela termina; uma falha não perde as anteriores
+                    transcript_file = os.path.join(course_output_directory, "transcript.jsonl")
+                    titles = [lesson_title(audio_file) for audio_file in course_metadata["transcription_audio_files"]]
+                    start_transcript(transcript_file)
+                    success, result = transcribe_lessons(course_metadata["transcription_audio_files"], progress=overall_progress, task_id=overall_task,
+                                                         on_result=lambda index, lesson: append_lesson(transcript_file, index, titles[index], lesson))
+                    if not success:
+                        message = result
+                    else:
+                        course_metadata["transcript"] = transcript_file
+                        # Salvar transcrição em arquivo, lida do JSONL em streaming
+                        transcription_file = write_transcript_text(transcript_file, os.path.join(course_output_directory, "transcription.txt"))
+                        course_metadata["transcription"] = transcription_file
                         message = transcription_file
                 else:
                     success, message = False, "No audio files to transcribe."
 
             elif step['name'] == "AI Summary Generation":
-                if course_metadata["transcription"]:
-                    success, summary_text = generate_summary_claude(course_metadata["transcription"], step['args'][1], progress=overall_progress, task_id=overall_task)
+                if course_metadata["transcript"]:
+                    # Aulas lidas do JSONL; transcrições longas são resumidas em map-reduce, por trechos de aulas
+                    lessons_text = ((title, text) for _, title, text in iter_lesson_texts(course_metadata["transcript"]))
+                    # O resumo é gravado em summary.md (em streaming, à medida que é gerado)
+                    summary_file = os.path.join(course_output_directory, "summary.md")
+                    artifact_prompts = [name for name in get_setting("summary", "artifacts", []) if name != step['args'][1]]
+                    if artifact_prompts:
+                        # Artefatos extras (notas, quiz...) são gerados em paralelo com o resumo, cada um em <prompt>.md
+                        success, summary_text = generate_course_artifacts(lessons_text, [step['args'][1]] + artifact_prompts, course_output_directory,
+                                                                          output_files={step['args'][1]: "summary.md"},
+                                                                          progress=overall_progress, task_id=overall_task)
+                        if success:
+                            with open(summary_file, "r", encoding="utf-8") as f: summary_text = f.read()
+                    else:
+                        success, summary_text = generate_course_summary(lessons_text, step['args'][1], progress=overall_progress, task_id=overall_task,
+                                                                        output_path=summary_file)
                     if success:
                         course_metadata["summary"] = summary_text
-                        # Salvar resumo em arquivo
-                        summary_file = os.path.join(output_base_directory, course_name, "summary.md")
-                        with open(summary_file, "w", encoding="utf-8") as f: f.write(summary_text)
                         message = summary_file
+                    else:
+                        message = summary_text
                 else:
                     success, message = False, "No transcription to summarize."
 
@@ -143,7 +197,12 @@ def process_complete_course(course_name: str, course_directory: str, output_base
 
             elif step['name'] == "Timestamp Generation":
                 if course_metadata["unified_audio"]:
-                    success, timestamps_text = generate_timestamps(course_metadata["unified_audio"], progress=overall_progress, task_id=overall_task)
+                    if get_setting("timestamps", "mode", "lessons") == "interval":
+                        success, timestamps_text = generate_timestamps(course_metadata["unified_audio"], get_setting("timestamps", "interval_minutes", 5),
+                                                                       progress=overall_progress, task_id=overall_task)
+                    else:
+                        # Um capítulo por aula, a partir das durações já conhecidas na unificação
+                        success, timestamps_text = generate_lesson_timestamps(course_metadata["audio_files"], progress=overall_progress, task_id=overall_task)
                     if success:
                         course_metadata["timestamps"] = timestamps_text
                         # Salvar timestamps em arquivo
@@ -172,7 +231,7 @@ def process_complete_course(course_name: str, course_directory: str, output_base
                         'description': course_metadata["summary"],
                         'enclosure_url': "https://example.com/" + os.path.basename(course_metadata["unified_audio"]), # Link temporário
                         'enclosure_length': str(os.path.getsize(course_metadata["unified_audio"])) if os.path.exists(course_metadata["unified_audio"]) else "0",
-                        'duration': "00:00:00", # Precisa calcular a duração real
+                        'duration': format_duration(get_duration(course_metadata["unified_audio"])),
                         'author': "NeuroDeamon",
                     }
                     success, message = update_rss_feed(rss_data, progress=overall_progress, task_id=overall_task)
@@ -196,6 +255,107 @@ def process_complete_course(course_name: str, course_directory: str, output_base
     console.print(f"\n[bold bright_green]✅ Full course processing completed for: {course_name}[/]")
     return True
 
+def find_courses_pending_summary() -> list:
+    """Retorna os cursos com transcrição salva e ainda sem resumo: [{id, name, metadata}].
+
+    Reprocessar um curso cria uma nova linha com o mesmo diretório de saída; só a linha mais
+    recente de cada diretório conta, para não resumir (e pagar) a mesma transcrição duas vezes
+    nem sobrescrever o summary.md de uma execução posterior.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, name, metadata_json FROM courses WHERE metadata_json IS NOT NULL ORDER BY id DESC")
+    rows = cursor.fetchall()
+    conn.close()
+
+    pending = []
+    seen_directories = set()
+    for row in rows:
+        metadata = json.loads(row['metadata_json'])
+        if not metadata.get("transcript"):
+            continue
+        output_directory = os.path.abspath(metadata.get("output_directory") or os.path.dirname(metadata["transcript"]))
+        if output_directory in seen_directories:
+            continue
+        seen_directories.add(output_directory)
+        if not metadata.get("summary") and os.path.exists(metadata["transcript"]):
+            pending.append({"id": row['id'], "name": row['name'], "metadata": metadata})
+    pending.reverse()
+    return pending
+
+def _save_course_summary(course: dict, summary_text: str):
+    """Grava o resumo de um curso em summary.md e nos metadados do curso."""
+    metadata = course["metadata"]
+    output_directory = metadata.get("output_directory") or os.path.dirname(metadata["transcript"])
+    summary_file = os.path.join(output_directory, "summary.md")
+    with open(summary_file, "w", encoding="utf-8") as f: f.write(summary_text)
+    metadata["summary"] = summary_text
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE courses SET metadata_json = ? WHERE id = ?", (json.dumps(metadata), course["id"]))
+    conn.commit()
+    conn.close()
+    _log_operation(course["id"], "Batch Summary Generation", "success", details={'message': summary_file})
+
+def summarize_pending_courses_batch(prompt_name: str = "summary_test", timeout: float = None, progress: Progress = None, task_id = None) -> (bool, str):
+    """Resume em lote (Message Batches API) todos os cursos com transcrição e sem resumo.
+
+    Lotes enviados antes e ainda não recolhidos (ex: o programa foi fechado durante a espera) são
+    aguardados e recolhidos primeiro; só os cursos que continuam sem resumo vão para um novo lote,
+    para não pagar duas vezes pelo mesmo resumo. Cada resumo vai para o summary.md e os metadados do curso.
+    """
+    def _apply(summaries: dict) -> int:
+        courses = {f"course-{course['id']}": course for course in find_courses_pending_summary()}
+        applied = 0
+        for custom_id, summary_text in summaries.items():
+            if custom_id in courses:
+                _save_course_summary(courses[custom_id], summary_text)
+                applied += 1
+        return applied
+
+    def _wait_and_apply(batch_id: str) -> (bool, object):
+        success, message = wait_for_summary_batch(batch_id, timeout, progress, task_id)
+        if not success:
+            return False, message
+        success, summaries = collect_summary_batch(batch_id)
+        if not success:
+            return False, summaries
+        return True, _apply(summaries)
+
+    total_applied = 0
+    for batch_id in list_open_summary_batches():
+        success, result = _wait_and_apply(batch_id)
+        if not success:
+            return False, result
+        total_applied += result
+
+    skipped = {}
+    pending = find_courses_pending_summary()
+    if pending:
+        inputs = {
+            f"course-{course['id']}": [(title, text) for _, title, text in iter_lesson_texts(course["metadata"]["transcript"])]
+            for course in pending
+        }
+        success, result = create_summary_batch(inputs, prompt_name, progress, task_id)
+        if not success:
+            return False, result
+        skipped = result["skipped"]
+        total_applied += _apply(result["cached"])
+        if result["batch_id"]:
+            success, result = _wait_and_apply(result["batch_id"])
+            if not success:
+                return False, result
+            total_applied += result
+
+    for custom_id, reason in skipped.items():
+        console.print(f"[yellow]⚠ {custom_id} was not summarized: {reason}[/]")
+    console.print(f"[bright_green]✓ Batch summaries written for {total_applied} courses[/]")
+    message = f"{total_applied} course summaries generated."
+    if skipped:
+        message += f" {len(skipped)} skipped: {', '.join(skipped)}."
+    return True, message
+
 # Exemplo de uso (para testes)
 if __name__ == "__main__":
     # Para testar, você precisaria de:
@@ -0,0 +1,46 @@
+# services/discovery_service.py
+
+import os
+import re
+from utils.logger import logger
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov")
+
+_DIGITS_RE = re.compile(r"(\d+)")
+
+def natural_sort_key(relative_path: str) -> tuple:
+    """Chave de ordenação natural por componente do caminho ("Aula 2" antes de "Aula 10")."""
+    return tuple(
+        tuple((0, int(chunk), chunk) if chunk.isdigit() else (1, chunk.casefold()) for chunk in _DIGITS_RE.split(component))
+        for component in relative_path.replace("\\", "/").split("/")
+    )
+
+def discover_course(course_directory: str, extensions: tuple = VIDEO_EXTENSIONS) -> list:
+    """Percorre a árvore do curso uma única vez (os.scandir) e retorna o índice ordenado das aulas.
+
+    Cada aula é um dict com path, relative_path, size e mtime; a ordem é natural por caminho.
+    """
+    lessons = []
+    pending_dirs = [course_directory]
+    while pending_dirs:
+        current_dir = pending_dirs.pop()
+        try:
+            with os.scandir(current_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending_dirs.append(entry.path)
+                    elif entry.is_file() and entry.name.lower().endswith(extensions):
+                        # O stat do DirEntry é reaproveitado (no Windows vem do próprio scandir)
+                        stat = entry.stat()
+                        lessons.append({
+                            "path": entry.path,
+                            "relative_path": os.path.relpath(entry.path, course_directory),
+                            "size": stat.st_size,
+                            "mtime": stat.st_mtime,
+                        })
+        except OSError as e:
+            logger.error(f"Error scanning {current_dir}: {e}")
+
+    lessons.sort(key=lambda lesson: natural_sort_key(lesson["relative_path"]))
+    logger.info(f"Discovered {len(lessons)} lessons in {course_directory}")
+    return lessons
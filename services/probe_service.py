@@ -0,0 +1,102 @@
+# services/probe_service.py
+
+import json
+import os
+import subprocess
+import threading
+from utils.database import get_db_connection
+from utils.logger import logger
+
+# Cache em memória, na frente do cache persistente em SQLite
+_probe_cache = {}
+_probe_cache_lock = threading.Lock()
+
+def _run_ffprobe(media_path: str) -> dict:
+    """Executa o ffprobe e extrai os metadados do formato e da primeira faixa de áudio, e se há faixa de vídeo."""
+    command = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration,bit_rate:stream=codec_type,codec_name,bit_rate,channels,sample_rate",
+        "-of", "json", media_path
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"ffprobe exited with code {result.returncode}")
+    data = json.loads(result.stdout or "{}")
+
+    def _to_number(value, cast):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            return None
+
+    format_info = data.get("format", {})
+    streams = data.get("streams", [])
+    audio_stream = next((stream for stream in streams if stream.get("codec_type") == "audio"), {})
+    return {
+        "duration": _to_number(format_info.get("duration"), float) or 0.0,
+        "format_bit_rate": _to_number(format_info.get("bit_rate"), int),
+        "codec": audio_stream.get("codec_name"),
+        "bit_rate": _to_number(audio_stream.get("bit_rate"), int),
+        "channels": _to_number(audio_stream.get("channels"), int),
+        "sample_rate": _to_number(audio_stream.get("sample_rate"), int),
+        "has_video": any(stream.get("codec_type") == "video" for stream in streams),
+    }
+
+def probe_media(media_path: str) -> dict:
+    """Retorna duration, codec, bit_rate, channels, sample_rate e has_video de um arquivo de mídia.
+
+    O resultado é cacheado por caminho, tamanho e mtime (em memória e no SQLite), então só o
+    primeiro acesso executa o ffprobe. Retorna None se o arquivo não puder ser analisado.
+    """
+    if not os.path.exists(media_path):
+        logger.error(f"Media file not found for probing: {media_path}")
+        return None
+
+    abs_path = os.path.abspath(media_path)
+    stat = os.stat(abs_path)
+    cache_key = (abs_path, stat.st_size, stat.st_mtime)
+
+    with _probe_cache_lock:
+        if cache_key in _probe_cache:
+            return dict(_probe_cache[cache_key])
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT probe_json FROM media_probe WHERE path = ? AND size = ? AND mtime = ?", cache_key)
+    entry = cursor.fetchone()
+    conn.close()
+
+    info = json.loads(entry['probe_json']) if entry is not None else None
+    # Entradas gravadas antes de has_video existir são analisadas de novo
+    if info is None or "has_video" not in info:
+        try:
+            info = _run_ffprobe(abs_path)
+        except FileNotFoundError:
+            logger.error("ffprobe not found. Please install ffmpeg and add it to your PATH.")
+            return None
+        except (RuntimeError, json.JSONDecodeError) as e:
+            logger.error(f"Error probing {media_path}: {e}")
+            return None
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT OR REPLACE INTO media_probe (path, size, mtime, probe_json) VALUES (?, ?, ?, ?)",
+            (abs_path, stat.st_size, stat.st_mtime, json.dumps(info))
+        )
+        conn.commit()
+        conn.close()
+
+    with _probe_cache_lock:
+        _probe_cache[cache_key] = info
+    return dict(info)
+
+def get_duration(media_path: str) -> float:
+    """Atalho para a duração (em segundos) de um arquivo de mídia; 0.0 se desconhecida."""
+    info = probe_media(media_path)
+    return info["duration"] if info else 0.0
+
+def format_duration(seconds: float) -> str:
+    """Formata uma duração em segundos como HH:MM:SS."""
+    total_seconds = int(seconds)
+    return f"{total_seconds // 3600:02d}:{total_seconds % 3600 // 60:02d}:{total_seconds % 60:02d}"
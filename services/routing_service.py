@@ -0,0 +1,66 @@
+# services/routing_service.py
+
+from utils.config import load_settings
+from utils.logger import logger
+
+# Rotas padrão: cada tarefa aponta para um nível, e cada nível lista modelos do menor para o maior.
+# A primeira rota do provedor cuja capacidade comporta a entrada estimada é usada; rotas sem
+# "provider" são da Anthropic. Os resumos de trechos (map) usam o nível rápido e o resumo final
+# (reduce) tem nível próprio, "large", que pode apontar para um modelo maior sem afetar as demais tarefas.
+DEFAULT_ROUTING = {
+    "safety_margin": 0.1,
+    "tasks": {"map": "fast", "reduce": "large", "summary": "standard", "artifact": "standard", "validation": "fast"},
+    "tiers": {
+        "fast": [{"model": "claude-3-haiku-20240307", "context_tokens": 190000},
+                 {"provider": "openai", "model": "gpt-4o-mini", "context_tokens": 120000},
+                 {"provider": "gemini", "model": "gemini-1.5-flash", "context_tokens": 1000000}],
+        "standard": [{"model": "claude-3-sonnet-20240229", "context_tokens": 190000},
+                     {"provider": "openai", "model": "gpt-4o", "context_tokens": 120000},
+                     {"provider": "gemini", "model": "gemini-1.5-pro", "context_tokens": 2000000}],
+        "large": [{"model": "claude-3-sonnet-20240229", "context_tokens": 190000},
+                  {"provider": "openai", "model": "gpt-4o", "context_tokens": 120000},
+                  {"provider": "gemini", "model": "gemini-1.5-pro", "context_tokens": 2000000}],
+    },
+}
+
+class ContextOverflowError(ValueError):
+    """A entrada estimada não cabe em nenhum modelo do nível da tarefa."""
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa grosseira de tokens (~4 caracteres por token), feita localmente, sem chamada à API."""
+    return len(text) // 4 + 1
+
+def routing_settings() -> dict:
+    """Tabela de roteamento de modelos (seção model_routing de settings.json)."""
+    settings = {**DEFAULT_ROUTING, "tasks": dict(DEFAULT_ROUTING["tasks"]), "tiers": dict(DEFAULT_ROUTING["tiers"])}
+    configured = load_settings().get("model_routing") or {}
+    settings["safety_margin"] = configured.get("safety_margin", settings["safety_margin"])
+    settings["tasks"].update(configured.get("tasks") or {})
+    settings["tiers"].update(configured.get("tiers") or {})
+    return settings
+
+def route_model(task: str, input_tokens: int, max_output_tokens: int = 0, provider: str = "anthropic") -> str:
+    """Escolhe o modelo de uma chamada pela tarefa (map, reduce, summary...), pelo tamanho da entrada e pelo provedor.
+
+    input_tokens vem de estimate_tokens e recebe a margem safety_margin, pois a estimativa é
+    aproximada. Se nenhuma rota do nível comportar a entrada mais max_output_tokens, levanta
+    ContextOverflowError antes de qualquer requisição.
+    """
+    settings = routing_settings()
+    tier = settings["tasks"].get(task, "standard")
+    routes = [route for route in settings["tiers"].get(tier) or [] if route.get("provider", "anthropic") == provider]
+    if not routes:
+        raise ValueError(f"No {provider} models configured for routing tier '{tier}' (task '{task}').")
+
+    needed = int(input_tokens * (1 + settings["safety_margin"])) + max_output_tokens
+    for route in routes:
+        if needed <= route["context_tokens"]:
+            logger.debug(f"Routing {task} ({input_tokens} tokens) to {provider}/{route['model']}")
+            return route["model"]
+    largest = max(route["context_tokens"] for route in routes)
+    raise ContextOverflowError(f"Input of ~{input_tokens} tokens for {task} exceeds the largest '{tier}' {provider} model context "
+                               f"of {largest} tokens ({max_output_tokens} reserved for output).")
+
+def route_prompt(task: str, prompt: str, max_output_tokens: int = 0, provider: str = "anthropic") -> str:
+    """Atalho de route_model para um prompt já montado."""
+    return route_model(task, estimate_tokens(prompt), max_output_tokens, provider)
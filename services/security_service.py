@@ -9,6 +9,9 @@ API_KEYS_FILE = os.path.join("config", "api_keys.json")
 # Chave simples para "embaralhar" os dados. Em um app real, isso seria mais robusto.
 SECRET_KEY = "neurodeamon_secret_key".encode('utf-8')
 
+# Incrementado a cada gravação das chaves, para que os clientes de API em cache sejam recriados
+_keys_version = 0
+
 def _xor_cipher(data, key):
     """Criptografia XOR simples."""
     return bytes([b ^ key[i % len(key)] for i, b in enumerate(data)])
@@ -50,12 +53,18 @@ def load_api_keys(encrypted: bool = True) -> dict:
         logger.error(f"Error decoding API keys JSON: {e}. Returning empty dict.")
         return {}
 
+def get_api_keys_version() -> int:
+    """Versão das chaves salvas nesta execução; muda a cada save_api_keys."""
+    return _keys_version
+
 def save_api_keys(keys: dict):
     """Salva as chaves de API no arquivo JSON, criptografando-as."""
+    global _keys_version
     encrypted_keys = {key: encrypt_key(value) for key, value in keys.items()}
     try:
         with open(API_KEYS_FILE, 'w') as f:
             json.dump(encrypted_keys, f, indent=4)
+        _keys_version += 1
         logger.info(f"API keys saved to {API_KEYS_FILE}.")
     except IOError as e:
         logger.error(f"Error saving API keys to {API_KEYS_FILE}: {e}")
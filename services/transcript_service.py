@@ -0,0 +1,106 @@
+# services/transcript_service.py
+
+import json
+import os
+import threading
+from utils.logger import logger
+
+# Serializa as gravações no JSONL: as aulas terminam em paralelo e cada uma deve ficar em um bloco contínuo
+_write_lock = threading.Lock()
+
+def format_lesson_text(title: str, text: str) -> str:
+    """Formata o texto de uma aula como seção Markdown da transcrição do curso."""
+    return f"## {title}\n\n{text}"
+
+def start_transcript(jsonl_path: str):
+    """Cria (ou esvazia) o arquivo JSONL de segmentos de um curso."""
+    os.makedirs(os.path.dirname(jsonl_path) or ".", exist_ok=True)
+    open(jsonl_path, "w", encoding="utf-8").close()
+
+def append_lesson(jsonl_path: str, lesson_index: int, title: str, result: dict):
+    """Acrescenta ao JSONL os segmentos de uma aula transcrita, um registro por linha.
+
+    Cada registro tem lesson, title, start, end e text. A aula é gravada de uma vez e sincronizada
+    em disco, para que uma falha posterior não perca as aulas já transcritas.
+    """
+    segments = result["segments"] or [{"start": 0.0, "end": 0.0, "text": result["text"]}]
+    lines = "".join(
+        json.dumps({"lesson": lesson_index, "title": title, "start": segment["start"], "end": segment["end"], "text": segment["text"]},
+                   ensure_ascii=False) + "\n"
+        for segment in segments
+    )
+    with _write_lock:
+        with open(jsonl_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+def _iter_records(jsonl_file):
+    """Percorre um JSONL aberto em modo binário, retornando (offset, tamanho da linha, registro).
+
+    Linhas inválidas (ex: a última linha de uma gravação interrompida) são ignoradas.
+    """
+    offset = 0
+    for line in jsonl_file:
+        line_offset = offset
+        offset += len(line)
+        try:
+            record = json.loads(line)
+        except ValueError:
+            logger.warning(f"Skipping malformed transcript line at byte {line_offset}")
+            continue
+        yield line_offset, len(line), record
+
+def iter_transcript_segments(jsonl_path: str, lesson_index: int = None):
+    """Lê os segmentos do JSONL em streaming (na ordem de gravação), opcionalmente só os de uma aula."""
+    with open(jsonl_path, "rb") as f:
+        for _, _, record in _iter_records(f):
+            if lesson_index is None or record["lesson"] == lesson_index:
+                yield record
+
+def _lesson_blocks(jsonl_file) -> dict:
+    """Indexa os blocos de bytes de cada aula no JSONL: {aula: [(offset, tamanho), ...]}."""
+    blocks = {}
+    current_lesson = None
+    for line_offset, line_length, record in _iter_records(jsonl_file):
+        lesson = record["lesson"]
+        if lesson == current_lesson:
+            block_offset, block_length = blocks[lesson][-1]
+            blocks[lesson][-1] = (block_offset, block_length + line_length)
+        else:
+            blocks.setdefault(lesson, []).append((line_offset, line_length))
+            current_lesson = lesson
+    return blocks
+
+def iter_lesson_texts(jsonl_path: str):
+    """Retorna (índice, título, texto) de cada aula, na ordem das aulas.
+
+    As aulas são gravadas na ordem em que terminam; uma primeira passada guarda só os offsets
+    de cada bloco, e a segunda lê uma aula por vez, então só o texto de uma aula fica em memória.
+    """
+    with open(jsonl_path, "rb") as f:
+        blocks = _lesson_blocks(f)
+        for lesson in sorted(blocks):
+            title = None
+            texts = []
+            for block_offset, block_length in blocks[lesson]:
+                f.seek(block_offset)
+                for line in f.read(block_length).splitlines():
+                    record = json.loads(line)
+                    title = record["title"]
+                    if record["text"]:
+                        texts.append(record["text"])
+            yield lesson, title, " ".join(texts)
+
+def write_transcript_text(jsonl_path: str, output_path: str) -> str:
+    """Gera a transcrição em texto (uma seção por aula) a partir do JSONL, em streaming."""
+    with open(output_path, "w", encoding="utf-8") as f:
+        for position, (_, title, text) in enumerate(iter_lesson_texts(jsonl_path)):
+            if position:
+                f.write("\n\n")
+            f.write(format_lesson_text(title, text))
+    return output_path
+
+def read_transcript_text(jsonl_path: str) -> str:
+    """Monta a transcrição completa do curso em memória, para etapas que precisam do texto inteiro."""
+    return "\n\n".join(format_lesson_text(title, text) for _, title, text in iter_lesson_texts(jsonl_path))
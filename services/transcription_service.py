@@ -1,56 +1,633 @@
 # services/transcription_service.py
 
+import asyncio
+import json
 import openai
 import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from rich.console import Console
 from rich.progress import Progress
-from services.security_service import load_api_keys
+from services.probe_service import probe_media
+from services.client_service import get_api_key, get_async_openai_client, get_openai_client, run_async
+from services.vad_service import remap_segments, trim_silence, vad_params
+from utils.config import load_settings
+from utils.database import get_db_connection
+from utils.cache_stats import HitCounter
+from utils.hashing import hash_file, hash_params
 from utils.logger import logger
 
 console = Console()
 
-def transcribe_audio(audio_path: str, progress: Progress = None, task_id = None) -> (bool, str):
-    """Transcreve um arquivo de áudio usando a API do OpenAI Whisper."""
-    keys = load_api_keys()
-    api_key = keys.get("openai_api_key")
+# Limite de tamanho por requisição da API do Whisper
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+# Contadores de acerto do cache de transcrição na sessão atual
+_cache_stats = HitCounter()
+
+_SILENCE_RE = re.compile(r"silence_(start|end): (-?[\d.]+)")
+
+def _transcription_settings() -> dict:
+    """Configurações de transcrição e do divisor por silêncio, definidas em settings.json."""
+    settings = {"backend": "openai", "model": "whisper-1", "language": None, "max_upload_mb": 24, "silence_noise_db": -35,
+                "silence_min_seconds": 0.5, "max_concurrency": 8, "prep_concurrency": 2}
+    settings.update(load_settings().get("transcription", {}))
+    return settings
+
+def detect_silences(audio_path: str, noise_db: float = -35, min_silence_seconds: float = 0.5) -> list:
+    """Detecta trechos de silêncio com o filtro silencedetect do ffmpeg; retorna [(início, fim)] em segundos."""
+    command = [
+        "ffmpeg", "-hide_banner", "-nostats", "-i", audio_path,
+        "-af", f"silencedetect=noise={noise_db}dB:d={min_silence_seconds}",
+        "-f", "null", "-"
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL, universal_newlines=True)
+
+    silences = []
+    silence_start = None
+    # O relatório sai no stderr; é interpretado linha a linha, sem acumular o log
+    for line in process.stderr:
+        match = _SILENCE_RE.search(line)
+        if not match:
+            continue
+        if match.group(1) == "start":
+            silence_start = max(0.0, float(match.group(2)))
+        elif silence_start is not None:
+            silences.append((silence_start, float(match.group(2))))
+            silence_start = None
+    process.wait()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg silencedetect failed for {audio_path}")
+    return silences
+
+def plan_chunks(duration: float, file_size: int, silences: list, max_bytes: int) -> list:
+    """Divide o áudio em trechos [(início, fim)] que cabem em max_bytes, cortando no meio dos silêncios.
+
+    Quando não há silêncio adequado antes do limite, o corte é feito no próprio limite.
+    """
+    if duration <= 0 or file_size <= max_bytes:
+        return [(0.0, duration)]
+
+    # Margem de 5% para variações de bitrate ao longo do arquivo
+    max_seconds = max_bytes * 0.95 / (file_size / duration)
+    cut_candidates = [(start + end) / 2 for start, end in silences]
+
+    chunks = []
+    chunk_start = 0.0
+    while duration - chunk_start > max_seconds:
+        limit = chunk_start + max_seconds
+        # Prefere o último silêncio da segunda metade do trecho, para não gerar trechos curtos demais
+        valid_cuts = [cut for cut in cut_candidates if chunk_start + max_seconds / 2 <= cut <= limit]
+        cut = valid_cuts[-1] if valid_cuts else limit
+        chunks.append((chunk_start, cut))
+        chunk_start = cut
+    chunks.append((chunk_start, duration))
+    return chunks
+
+def split_audio(audio_path: str, chunks: list, output_directory: str) -> list:
+    """Divide o áudio nos trechos planejados com uma única passada do ffmpeg, sem recodificar."""
+    extension = os.path.splitext(audio_path)[1]
+    output_pattern = os.path.join(output_directory, f"segment_%04d{extension}")
+    command = [
+        "ffmpeg", "-y", "-loglevel", "error", "-i", audio_path,
+        "-map", "0:a", "-c", "copy",
+        "-f", "segment", "-segment_times", ",".join(f"{start:.3f}" for start, _ in chunks[1:]),
+        "-reset_timestamps", "1",
+        output_pattern
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, stdin=subprocess.DEVNULL)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to split {audio_path}: {result.stderr.strip()}")
+    return [output_pattern % index for index in range(len(chunks))]
+
+def _segment_value(segment, key: str):
+    """Lê um campo de um segmento da resposta, seja ele objeto do SDK ou dict."""
+    return segment.get(key) if isinstance(segment, dict) else getattr(segment, key)
+
+def _transcription_request(settings: dict) -> dict:
+    """Parâmetros da requisição de transcrição (segmentos com tempos via verbose_json)."""
+    request = {"model": settings["model"], "response_format": "verbose_json", "timestamp_granularities": ["segment"]}
+    if settings["language"]:
+        request["language"] = settings["language"]
+    return request
+
+def _parse_transcript(transcript, offset: float = 0.0) -> dict:
+    """Converte a resposta do Whisper em texto e segmentos deslocados por offset."""
+    segments = [
+        {
+            "start": offset + _segment_value(segment, "start"),
+            "end": offset + _segment_value(segment, "end"),
+            "text": _segment_value(segment, "text").strip(),
+        }
+        for segment in (transcript.segments or [])
+    ]
+    return {"text": transcript.text.strip(), "segments": segments}
+
+def _merge_chunk_results(chunk_results: list, offset_map: list = None) -> dict:
+    """Costura, em ordem, os resultados dos trechos de um mesmo arquivo.
+
+    Com offset_map (áudio recortado pelo VAD), os tempos voltam a se referir ao áudio original.
+    """
+    segments = [segment for result in chunk_results for segment in result["segments"]]
+    return {
+        "text": " ".join(result["text"] for result in chunk_results if result["text"]),
+        "segments": remap_segments(segments, offset_map),
+    }
+
+def _prep_params(settings: dict) -> dict:
+    """Parâmetros da cópia otimizada para fala (mono, 16kHz, baixo bitrate) enviada à API."""
+    params = {"enabled": True, "codec": "mp3", "sample_rate": 16000, "bitrate": "32k"}
+    params.update(settings.get("prep") or {})
+    return params
+
+def prepare_for_transcription(audio_path: str, settings: dict = None) -> str:
+    """Retorna o arquivo a ser enviado para transcrição: uma cópia 16kHz mono em baixo bitrate (MP3 ou Opus).
+
+    Se o áudio já estiver nesse formato (ex: o áudio de transcrição gerado na conversão), ele é usado
+    como está. As cópias ficam em cache no diretório temporário, indexadas por caminho, tamanho, mtime
+    e parâmetros, e só são recriadas quando a origem muda.
+    """
+    params = _prep_params(settings or _transcription_settings())
+    if not params["enabled"]:
+        return audio_path
+
+    target_bitrate = int(params["bitrate"].rstrip("k")) * 1000
+    media_info = probe_media(audio_path)
+    if media_info and media_info["channels"] == 1 and (media_info["sample_rate"] or 0) <= params["sample_rate"] \
+            and (media_info["bit_rate"] or 0) <= target_bitrate * 1.1:
+        return audio_path
+
+    stat = os.stat(audio_path)
+    cache_name = hash_params({"path": os.path.abspath(audio_path), "size": stat.st_size, "mtime": stat.st_mtime, **params})
+    extension = ".ogg" if params["codec"] == "opus" else ".mp3"
+    prep_directory = os.path.join(load_settings().get("default_temp_directory", "temp"), "transcription_prep")
+    prep_path = os.path.join(prep_directory, cache_name + extension)
+    if os.path.exists(prep_path):
+        return prep_path
+
+    os.makedirs(prep_directory, exist_ok=True)
+    codec_args = ["-c:a", "libopus", "-application", "voip"] if params["codec"] == "opus" else ["-c:a", "libmp3lame"]
+    partial_path = prep_path + ".partial" + extension
+    command = [
+        "ffmpeg", "-y", "-loglevel", "error", "-i", audio_path, "-vn",
+        "-ac", "1", "-ar", str(params["sample_rate"]), *codec_args, "-b:a", params["bitrate"],
+        partial_path
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, stdin=subprocess.DEVNULL)
+    if result.returncode != 0:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise RuntimeError(f"ffmpeg failed to prepare {audio_path} for transcription: {result.stderr.strip()}")
+    # Renomeia só no final, para que uma cópia interrompida nunca seja reaproveitada
+    os.replace(partial_path, prep_path)
+
+    logger.info(f"Prepared {os.path.basename(audio_path)} for transcription: {stat.st_size} -> {os.path.getsize(prep_path)} bytes")
+    return prep_path
+
+def _trim_non_speech(audio_path: str, settings: dict) -> (str, list):
+    """Aplica o VAD ao áudio; em caso de falha, segue com o áudio completo (o VAD é só uma economia)."""
+    try:
+        return trim_silence(audio_path, settings, _prep_params(settings))
+    except Exception as e:
+        logger.warning(f"VAD failed for {os.path.basename(audio_path)}, transcribing the full audio: {e}")
+        return audio_path, None
 
+def _prepare_chunks(audio_path: str, settings: dict, max_bytes: int = None) -> (list, str, list):
+    """Retorna os trechos [(offset, caminho)] a transcrever, o diretório temporário criado (ou None) e o
+    mapa de deslocamento do VAD (ou None).
+
+    Os trechos sem fala são removidos primeiro. Sem max_bytes (backends locais, sem limite de upload)
+    o arquivo é transcrito inteiro. Caso contrário, o áudio passa pela pré-codificação para fala;
+    arquivos dentro do limite são enviados inteiros e os maiores são divididos nos silêncios.
+    """
+    audio_path, offset_map = _trim_non_speech(audio_path, settings)
+    if max_bytes is None:
+        return [(0.0, audio_path)], None, offset_map
+
+    audio_path = prepare_for_transcription(audio_path, settings)
+    file_size = os.path.getsize(audio_path)
+    if file_size <= max_bytes:
+        return [(0.0, audio_path)], None, offset_map
+
+    media_info = probe_media(audio_path)
+    if not media_info or not media_info["duration"]:
+        raise RuntimeError(f"Could not determine the duration of {audio_path} to split it.")
+
+    silences = detect_silences(audio_path, settings["silence_noise_db"], settings["silence_min_seconds"])
+    chunks = plan_chunks(media_info["duration"], file_size, silences, max_bytes)
+    logger.info(f"{os.path.basename(audio_path)} exceeds the upload limit; transcribing in {len(chunks)} silence-aligned chunks.")
+
+    chunks_directory = tempfile.mkdtemp(prefix="neurodeamon_chunks_")
+    try:
+        chunk_files = split_audio(audio_path, chunks, chunks_directory)
+    except Exception:
+        shutil.rmtree(chunks_directory, ignore_errors=True)
+        raise
+    return [(chunk_start, chunk_file) for (chunk_start, _), chunk_file in zip(chunks, chunk_files)], chunks_directory, offset_map
+
+def _get_openai_api_key() -> str:
+    """Retorna a chave da OpenAI configurada, ou None se não estiver definida."""
+    api_key = get_api_key("openai_api_key")
     if not api_key or api_key == "sk-your-key-here":
         logger.warning("OpenAI API key not set or is default. Skipping transcription.")
-        return False, "OpenAI API key not set. Please configure it in settings."
+        return None
+    return api_key
+
+class TranscriptionBackend(ABC):
+    """Interface dos backends de transcrição.
+
+    Um backend transcreve um arquivo em {text, segments}, com os tempos deslocados por offset.
+    ensure_ready é chamado só depois das consultas ao cache, antes da primeira transcrição.
+    """
+    name = None
+
+    def __init__(self, settings: dict):
+        self.settings = settings
+
+    @property
+    def model_name(self) -> str:
+        return self.settings["model"]
+
+    @abstractmethod
+    def cache_params(self) -> dict:
+        """Parâmetros que, junto com o hash do áudio, formam a chave do cache de transcrição."""
+
+    def max_upload_bytes(self) -> int:
+        """Tamanho máximo por arquivo; None indica que o áudio é transcrito inteiro, sem divisão."""
+        return None
+
+    def max_concurrency(self) -> int:
+        """Quantidade padrão de transcrições simultâneas."""
+        return self.settings["max_concurrency"]
+
+    def ensure_ready(self) -> (bool, str):
+        """Verifica se o backend pode transcrever (credenciais, dependências, modelo carregado)."""
+        return True, ""
+
+    @abstractmethod
+    def transcribe(self, audio_path: str, offset: float = 0.0) -> dict:
+        """Transcreve um arquivo em {text, segments}, com os tempos deslocados por offset."""
+
+    async def transcribe_async(self, audio_path: str, offset: float = 0.0) -> dict:
+        # Por padrão, a transcrição síncrona roda em uma thread para não bloquear o event loop
+        return await asyncio.to_thread(self.transcribe, audio_path, offset)
+
+    async def aclose(self):
+        pass
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    """Transcrição pela API hospedada do OpenAI Whisper."""
+    name = "openai"
+
+    def cache_params(self) -> dict:
+        return {"prep": _prep_params(self.settings), **_transcription_request(self.settings)}
+
+    def max_upload_bytes(self) -> int:
+        return min(int(self.settings["max_upload_mb"] * 1024 * 1024), MAX_UPLOAD_BYTES)
+
+    def ensure_ready(self) -> (bool, str):
+        if not _get_openai_api_key():
+            return False, "OpenAI API key not set. Please configure it in settings."
+        return True, ""
+
+    def transcribe(self, audio_path: str, offset: float = 0.0) -> dict:
+        with open(audio_path, "rb") as audio_file:
+            transcript = get_openai_client().audio.transcriptions.create(file=audio_file, **_transcription_request(self.settings))
+        return _parse_transcript(transcript, offset)
+
+    async def transcribe_async(self, audio_path: str, offset: float = 0.0) -> dict:
+        with open(audio_path, "rb") as audio_file:
+            transcript = await get_async_openai_client().audio.transcriptions.create(file=audio_file, **_transcription_request(self.settings))
+        return _parse_transcript(transcript, offset)
 
+# Modelos locais já carregados, compartilhados entre execuções (carregar um modelo leva segundos)
+_local_models = {}
+_local_models_lock = threading.Lock()
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """Transcrição local em CPU com faster-whisper (CTranslate2, int8), sem acesso à rede.
+
+    Cada arquivo passa pelo BatchedInferencePipeline, que transcreve vários trechos de ~30s do
+    áudio em lote. Os núcleos são divididos entre workers, cada um com seu grupo de threads,
+    para que várias aulas sejam transcritas em paralelo.
+    """
+    name = "local"
+
+    def __init__(self, settings: dict):
+        super().__init__(settings)
+        self.local = {"model": "small", "compute_type": "int8", "batch_size": 8, "beam_size": 5,
+                      "workers": 0, "cpu_threads": 0, "download_root": None, "local_files_only": False}
+        self.local.update(settings.get("local") or {})
+        cores = os.cpu_count() or 1
+        self.workers = self.local["workers"] or max(1, cores // 4)
+        self.cpu_threads = self.local["cpu_threads"] or max(1, cores // self.workers)
+        self._pipeline = None
+
+    @property
+    def model_name(self) -> str:
+        return f"faster-whisper/{self.local['model']}"
+
+    def cache_params(self) -> dict:
+        # Threads e workers não mudam o resultado, então ficam fora da chave
+        return {"backend": self.name, "model": self.local["model"], "compute_type": self.local["compute_type"],
+                "beam_size": self.local["beam_size"], "language": self.settings["language"]}
+
+    def max_concurrency(self) -> int:
+        return self.workers
+
+    def ensure_ready(self) -> (bool, str):
+        try:
+            from faster_whisper import BatchedInferencePipeline, WhisperModel
+        except ImportError:
+            logger.error("faster-whisper is not installed; the local transcription backend is unavailable.")
+            return False, "faster-whisper is not installed. Install it with 'pip install faster-whisper' to use the local backend."
+
+        model_key = (self.local["model"], self.local["compute_type"], self.cpu_threads, self.workers)
+        try:
+            with _local_models_lock:
+                if model_key not in _local_models:
+                    logger.info(f"Loading local Whisper model '{self.local['model']}' ({self.local['compute_type']}, "
+                                f"{self.workers} workers x {self.cpu_threads} threads)")
+                    model = WhisperModel(
+                        self.local["model"], device="cpu", compute_type=self.local["compute_type"],
+                        cpu_threads=self.cpu_threads, num_workers=self.workers,
+                        download_root=self.local["download_root"], local_files_only=self.local["local_files_only"]
+                    )
+                    _local_models[model_key] = BatchedInferencePipeline(model=model)
+                self._pipeline = _local_models[model_key]
+        except Exception as e:
+            logger.error(f"Failed to load local Whisper model '{self.local['model']}': {e}")
+            return False, f"Failed to load local Whisper model '{self.local['model']}': {e}"
+        return True, ""
+
+    def transcribe(self, audio_path: str, offset: float = 0.0) -> dict:
+        segments, _ = self._pipeline.transcribe(
+            audio_path, language=self.settings["language"],
+            batch_size=self.local["batch_size"], beam_size=self.local["beam_size"]
+        )
+        # Os segmentos são gerados sob demanda; a inferência acontece durante a iteração
+        parsed = [{"start": offset + segment.start, "end": offset + segment.end, "text": segment.text.strip()} for segment in segments]
+        return {"text": " ".join(segment["text"] for segment in parsed if segment["text"]), "segments": parsed}
+
+TRANSCRIPTION_BACKENDS = {backend.name: backend for backend in (OpenAIWhisperBackend, LocalWhisperBackend)}
+
+def get_transcription_backend(settings: dict = None) -> (bool, TranscriptionBackend):
+    """Instancia o backend configurado em transcription.backend; retorna (False, mensagem) se for desconhecido."""
+    settings = settings or _transcription_settings()
+    backend_class = TRANSCRIPTION_BACKENDS.get(settings["backend"])
+    if backend_class is None:
+        logger.error(f"Unknown transcription backend: {settings['backend']}")
+        return False, f"Unknown transcription backend '{settings['backend']}'. Available: {', '.join(TRANSCRIPTION_BACKENDS)}"
+    return True, backend_class(settings)
+
+def _transcription_cache_key(audio_hash: str, backend: TranscriptionBackend) -> str:
+    """Chave do cache: hash do conteúdo do áudio + backend, modelo, idioma e demais parâmetros que afetam o resultado."""
+    params = {"audio": audio_hash, **backend.cache_params()}
+    vad = vad_params(backend.settings)
+    if vad["enabled"]:
+        params["vad"] = vad
+    return hash_params(params)
+
+def _get_cached_transcription(audio_path: str, backend: TranscriptionBackend) -> (str, str, dict):
+    """Consulta o cache de transcrição; retorna (hash do áudio, chave, resultado ou None)."""
+    audio_hash = hash_file(audio_path)
+    cache_key = _transcription_cache_key(audio_hash, backend)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT result_json FROM transcription_cache WHERE cache_key = ?", (cache_key,))
+    entry = cursor.fetchone()
+    if entry is not None:
+        cursor.execute("UPDATE transcription_cache SET hit_count = hit_count + 1, last_used_at = CURRENT_TIMESTAMP WHERE cache_key = ?", (cache_key,))
+        conn.commit()
+    conn.close()
+
+    _cache_stats.record(entry is not None)
+
+    if entry is None:
+        return audio_hash, cache_key, None
+    logger.info(f"Transcription cache hit: {os.path.basename(audio_path)}")
+    return audio_hash, cache_key, json.loads(entry['result_json'])
+
+def _store_transcription(cache_key: str, audio_hash: str, backend: TranscriptionBackend, result: dict):
+    """Grava uma transcrição no cache persistente."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT OR REPLACE INTO transcription_cache (cache_key, audio_hash, model, language, result_json) VALUES (?, ?, ?, ?, ?)",
+        (cache_key, audio_hash, backend.model_name, backend.settings["language"], json.dumps(result))
+    )
+    conn.commit()
+    conn.close()
+
+def invalidate_transcription_cache(audio_path: str = None) -> int:
+    """Remove do cache as transcrições de um arquivo (por conteúdo), ou todas se audio_path for None.
+
+    Retorna o número de entradas removidas.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if audio_path:
+        cursor.execute("DELETE FROM transcription_cache WHERE audio_hash = ?", (hash_file(audio_path),))
+    else:
+        cursor.execute("DELETE FROM transcription_cache")
+    removed = cursor.rowcount
+    conn.commit()
+    conn.close()
+    logger.info(f"Invalidated {removed} transcription cache entries.")
+    return removed
+
+def get_transcription_cache_stats() -> dict:
+    """Retorna o tamanho do cache, os acertos acumulados e a taxa de acerto da sessão atual."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) AS entries, COALESCE(SUM(hit_count), 0) AS total_hits FROM transcription_cache")
+    row = cursor.fetchone()
+    conn.close()
+
+    return {"entries": row['entries'], "total_hits": row['total_hits'], **_cache_stats.snapshot()}
+
+def _transcription_error_message(error: Exception) -> str:
+    """Registra no log e traduz um erro de transcrição para a mensagem exibida ao usuário."""
+    if isinstance(error, openai.AuthenticationError):
+        logger.error("OpenAI Authentication failed. Check your API key.")
+        return "OpenAI Authentication failed. Check your API key."
+    if isinstance(error, openai.APIConnectionError):
+        logger.error(f"OpenAI API connection error: {error}")
+        return f"OpenAI API connection error: {error}"
+    if isinstance(error, openai.RateLimitError):
+        logger.error("OpenAI API rate limit exceeded.")
+        return "OpenAI API rate limit exceeded. Please wait and try again."
+    logger.error(f"An unexpected error occurred during transcription: {error}")
+    return f"An unexpected error occurred during transcription: {error}"
+
+def transcribe_audio_detailed(audio_path: str, progress: Progress = None, task_id = None) -> (bool, dict):
+    """Transcreve um arquivo de áudio com o backend configurado, retornando texto e segmentos com tempos.
+
+    No backend da OpenAI, arquivos acima do limite de upload são divididos nos silêncios em trechos
+    menores, transcritos um a um e costurados em ordem, com os tempos ajustados para o áudio original.
+    """
     if not os.path.exists(audio_path):
         logger.error(f"Audio file not found for transcription: {audio_path}")
         return False, f"Audio file not found: {audio_path}"
 
+    settings = _transcription_settings()
+    success, backend = get_transcription_backend(settings)
+    if not success:
+        return False, backend
+
+    # O cache é consultado antes de qualquer chamada de rede ou carga de modelo
+    audio_hash, cache_key, cached_result = _get_cached_transcription(audio_path, backend)
+    if cached_result is not None:
+        return True, cached_result
+
+    ready, message = backend.ensure_ready()
+    if not ready:
+        return False, message
+
+    chunks_directory = None
+
     try:
-        client = openai.OpenAI(api_key=api_key)
-        
         if progress and task_id is not None:
             progress.update(task_id, description=f"Transcribing [bright_white]{os.path.basename(audio_path)}[/]...")
 
-        with open(audio_path, "rb") as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file
-            )
-        
+        chunks, chunks_directory, offset_map = _prepare_chunks(audio_path, settings, backend.max_upload_bytes())
+        chunk_results = []
+        for index, (offset, chunk_file) in enumerate(chunks):
+            if progress and task_id is not None and len(chunks) > 1:
+                progress.update(task_id, description=f"Transcribing [bright_white]{os.path.basename(audio_path)}[/] (chunk {index + 1}/{len(chunks)})...")
+            chunk_results.append(backend.transcribe(chunk_file, offset))
+
+        result = _merge_chunk_results(chunk_results, offset_map)
+        _store_transcription(cache_key, audio_hash, backend, result)
+        logger.info(f"Successfully transcribed ({backend.name}): {os.path.basename(audio_path)}")
+        return True, result
+    except Exception as e:
+        return False, _transcription_error_message(e)
+    finally:
+        if chunks_directory:
+            shutil.rmtree(chunks_directory, ignore_errors=True)
+
+async def transcribe_lessons_async(audio_files: list, max_concurrency: int = None, progress: Progress = None, task_id = None,
+                                   on_result = None) -> (bool, list):
+    """Transcreve todas as aulas (e seus trechos) concorrentemente com o backend configurado.
+
+    No máximo max_concurrency transcrições ficam em andamento ao mesmo tempo (padrão: max_concurrency
+    de settings.json na API, ou a quantidade de workers no backend local). O preparo com ffmpeg (VAD,
+    compressão e divisão) roda em um pool próprio de prep_concurrency threads, e só essa quantidade
+    de aulas além das em transcrição fica em andamento, limitando os diretórios temporários.
+    Retorna (True, resultados na ordem das aulas) ou (False, mensagem do primeiro erro).
+
+    Com on_result(índice, resultado), cada aula é entregue assim que fica pronta (as do cache
+    primeiro) e os resultados não são retidos em memória: a lista retornada fica vazia.
+    """
+    for audio_path in audio_files:
+        if not os.path.exists(audio_path):
+            logger.error(f"Audio file not found for transcription: {audio_path}")
+            return False, f"Audio file not found: {audio_path}"
+
+    settings = _transcription_settings()
+    success, backend = get_transcription_backend(settings)
+    if not success:
+        return False, backend
+
+    results = [] if on_result else [None] * len(audio_files)
+    loop = asyncio.get_running_loop()
+    # Gravações (cache e on_result) em uma thread própria: não esperam atrás do preparo das outras aulas
+    write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transcription-write")
+    prep_executor = None
+
+    async def _deliver(index: int, result: dict):
+        if on_result:
+            await loop.run_in_executor(write_executor, on_result, index, result)
+        else:
+            results[index] = result
+
+    lessons_task = None
+    try:
+        # O cache é consultado antes de qualquer chamada de rede; só as aulas ausentes são transcritas
+        cache_lookups = []
+        missing = []
+        for index, audio_path in enumerate(audio_files):
+            audio_hash, cache_key, cached_result = await loop.run_in_executor(write_executor, _get_cached_transcription, audio_path, backend)
+            cache_lookups.append((audio_hash, cache_key))
+            if cached_result is None:
+                missing.append(index)
+            else:
+                await _deliver(index, cached_result)
+        if not missing:
+            return True, results
+
+        # A carga de um modelo local pode levar segundos; roda fora do event loop
+        ready, message = await asyncio.to_thread(backend.ensure_ready)
+        if not ready:
+            return False, message
+
+        concurrency = max_concurrency or backend.max_concurrency()
+        prep_workers = max(1, settings["prep_concurrency"])
+        prep_executor = ThreadPoolExecutor(max_workers=prep_workers, thread_name_prefix="transcription-prep")
+        semaphore = asyncio.Semaphore(concurrency)
+        # Aulas em andamento (preparo + transcrição): o preparo adianta no máximo prep_workers aulas
+        lesson_semaphore = asyncio.Semaphore(concurrency + prep_workers)
+        max_bytes = backend.max_upload_bytes()
+
         if progress and task_id is not None:
-            progress.update(task_id, advance=100) # Completa a tarefa
+            lessons_task = progress.add_task("Transcribing lessons...", total=len(audio_files), completed=len(audio_files) - len(missing))
 
-        logger.info(f"Successfully transcribed: {os.path.basename(audio_path)}")
-        return True, transcript.text
-    except openai.AuthenticationError:
-        logger.error("OpenAI Authentication failed. Check your API key.")
-        return False, "OpenAI Authentication failed. Check your API key."
-    except openai.APIConnectionError as e:
-        logger.error(f"OpenAI API connection error: {e}")
-        return False, f"OpenAI API connection error: {e}"
-    except openai.RateLimitError:
-        logger.error("OpenAI API rate limit exceeded.")
-        return False, "OpenAI API rate limit exceeded. Please wait and try again."
+        async def _transcribe_chunk(chunk_file: str, offset: float) -> dict:
+            async with semaphore:
+                return await backend.transcribe_async(chunk_file, offset)
+
+        async def _transcribe_lesson(index: int):
+            audio_path = audio_files[index]
+            audio_hash, cache_key = cache_lookups[index]
+            async with lesson_semaphore:
+                # O VAD e a divisão (ffmpeg) rodam no pool de preparo, fora do event loop
+                chunks, chunks_directory, offset_map = await loop.run_in_executor(prep_executor, _prepare_chunks, audio_path, settings, max_bytes)
+                try:
+                    chunk_results = await asyncio.gather(*(_transcribe_chunk(chunk_file, offset) for offset, chunk_file in chunks))
+                finally:
+                    if chunks_directory:
+                        shutil.rmtree(chunks_directory, ignore_errors=True)
+            if lessons_task is not None:
+                progress.update(lessons_task, advance=1, description=f"Transcribed [bright_white]{os.path.basename(audio_path)}[/]")
+            result = _merge_chunk_results(chunk_results, offset_map)
+            await loop.run_in_executor(write_executor, _store_transcription, cache_key, audio_hash, backend, result)
+            logger.info(f"Successfully transcribed ({backend.name}): {os.path.basename(audio_path)}")
+            await _deliver(index, result)
+
+        await asyncio.gather(*(_transcribe_lesson(index) for index in missing))
+        return True, results
     except Exception as e:
-        logger.error(f"An unexpected error occurred during transcription: {e}")
-        return False, f"An unexpected error occurred during transcription: {e}"
+        return False, _transcription_error_message(e)
+    finally:
+        await backend.aclose()
+        if prep_executor is not None:
+            prep_executor.shutdown(wait=False, cancel_futures=True)
+        write_executor.shutdown(wait=False)
+        if lessons_task is not None:
+            progress.update(lessons_task, visible=False)
+
+def transcribe_lessons(audio_files: list, max_concurrency: int = None, progress: Progress = None, task_id = None,
+                       on_result = None) -> (bool, list):
+    """Ponto de entrada síncrono de transcribe_lessons_async."""
+    return run_async(transcribe_lessons_async(audio_files, max_concurrency, progress, task_id, on_result))
+
+def transcribe_audio(audio_path: str, progress: Progress = None, task_id = None) -> (bool, str):
+    """Transcreve um arquivo de áudio com o backend configurado, retornando só o texto."""
+    success, result = transcribe_audio_detailed(audio_path, progress, task_id)
+    if not success:
+        return False, result
+
+    if progress and task_id is not None:
+        progress.update(task_id, advance=100) # Completa a tarefa
+    return True, result["text"]
 
 # Exemplo de uso (para testes)
 if __name__ == "__main__":
@@ -0,0 +1,192 @@
+# services/vad_service.py
+
+import bisect
+import json
+import os
+import subprocess
+import numpy as np
+from utils.config import load_settings
+from utils.hashing import hash_params
+from utils.logger import logger
+
+VAD_SAMPLE_RATE = 16000
+# Teto do limiar adaptativo: acima disso, fala baixa passaria a ser cortada
+MAX_THRESHOLD_DB = -30.0
+# Quantidade de frames lidos do pipe do ffmpeg por vez
+FRAMES_PER_READ = 2048
+
+def vad_params(settings: dict) -> dict:
+    """Parâmetros do detector de atividade de voz (seção transcription.vad de settings.json)."""
+    params = {"enabled": True, "frame_ms": 30, "threshold_db": -45.0, "adaptive_margin_db": 8.0,
+              "min_silence_seconds": 1.5, "padding_seconds": 0.25, "min_speech_seconds": 0.25, "min_saving_ratio": 0.05}
+    params.update(settings.get("vad") or {})
+    return params
+
+def frame_energies(audio_path: str, frame_ms: int = 30) -> np.ndarray:
+    """Decodifica o áudio para PCM 16kHz mono (s16le) via pipe do ffmpeg e retorna a energia RMS de cada frame em dBFS.
+
+    O PCM é lido em blocos, então só as energias (um float por frame) ficam em memória.
+    """
+    frame_samples = VAD_SAMPLE_RATE * frame_ms // 1000
+    block_bytes = frame_samples * FRAMES_PER_READ * 2
+    command = [
+        "ffmpeg", "-loglevel", "error", "-i", audio_path, "-vn",
+        "-ac", "1", "-ar", str(VAD_SAMPLE_RATE), "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1"
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+
+    energies = []
+    leftover = b""
+    while True:
+        block = process.stdout.read(block_bytes)
+        if not block:
+            break
+        data = leftover + block
+        usable = len(data) - len(data) % (frame_samples * 2)
+        leftover = data[usable:]
+        if not usable:
+            continue
+        frames = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32).reshape(-1, frame_samples) / 32768.0
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        energies.append(20.0 * np.log10(np.maximum(rms, 1e-10)))
+    stderr = process.stderr.read().decode("utf-8", errors="replace")
+    process.wait()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {audio_path} for VAD: {stderr.strip()}")
+    return np.concatenate(energies) if energies else np.zeros(0, dtype=np.float32)
+
+def _mask_to_regions(mask: np.ndarray) -> list:
+    """Converte uma máscara booleana de frames em intervalos [(início, fim)] em índices de frame."""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(edges[0::2].tolist(), edges[1::2].tolist()))
+
+def detect_speech(audio_path: str, params: dict) -> (list, float):
+    """Detecta os trechos com fala; retorna ([(início, fim)] em segundos, duração total analisada).
+
+    Um frame é fala quando sua energia supera o limiar: o maior entre threshold_db e o ruído de
+    fundo estimado (percentil 10) mais adaptive_margin_db, limitado a MAX_THRESHOLD_DB. Só pausas
+    de pelo menos min_silence_seconds são cortadas, e cada trecho de fala ganha padding_seconds
+    de margem dos dois lados.
+    """
+    energies = frame_energies(audio_path, params["frame_ms"])
+    frame_seconds = params["frame_ms"] / 1000
+    total_duration = len(energies) * frame_seconds
+    if not len(energies):
+        return [], 0.0
+
+    noise_floor = float(np.percentile(energies, 10))
+    threshold = min(max(params["threshold_db"], noise_floor + params["adaptive_margin_db"]), MAX_THRESHOLD_DB)
+    voiced = energies > threshold
+
+    speech = []
+    for start, end in _mask_to_regions(voiced):
+        start_seconds = max(0.0, start * frame_seconds - params["padding_seconds"])
+        end_seconds = min(total_duration, end * frame_seconds + params["padding_seconds"])
+        # Junta trechos separados por pausas curtas demais para valer o corte
+        if speech and start_seconds - speech[-1][1] < params["min_silence_seconds"]:
+            speech[-1] = (speech[-1][0], end_seconds)
+        else:
+            speech.append((start_seconds, end_seconds))
+
+    speech = [(start, end) for start, end in speech if end - start >= params["min_speech_seconds"]]
+    return speech, total_duration
+
+def build_offset_map(speech: list) -> list:
+    """Monta o mapa de deslocamento [(início no áudio recortado, início no original)] de cada trecho mantido."""
+    offset_map = []
+    trimmed_position = 0.0
+    for start, end in speech:
+        offset_map.append((trimmed_position, start))
+        trimmed_position += end - start
+    return offset_map
+
+def _remap_time(seconds: float, offset_map: list, trimmed_starts: list, is_end: bool = False) -> float:
+    # Um fim que cai exatamente na junção de dois trechos pertence ao trecho anterior, não ao seguinte
+    bisect_function = bisect.bisect_left if is_end else bisect.bisect_right
+    index = max(0, bisect_function(trimmed_starts, seconds) - 1)
+    trimmed_start, original_start = offset_map[index]
+    return original_start + (seconds - trimmed_start)
+
+def to_original_time(seconds: float, offset_map: list) -> float:
+    """Converte um tempo do áudio recortado para o tempo correspondente no áudio original."""
+    if not offset_map:
+        return seconds
+    return _remap_time(seconds, offset_map, [trimmed for trimmed, _ in offset_map])
+
+def remap_segments(segments: list, offset_map: list) -> list:
+    """Reescreve os tempos dos segmentos transcritos do áudio recortado para o áudio original."""
+    if not offset_map:
+        return segments
+    trimmed_starts = [trimmed for trimmed, _ in offset_map]
+    return [
+        {**segment, "start": _remap_time(segment["start"], offset_map, trimmed_starts), "end": _remap_time(segment["end"], offset_map, trimmed_starts, is_end=True)}
+        for segment in segments
+    ]
+
+def trim_silence(audio_path: str, settings: dict, output_params: dict) -> (str, list):
+    """Remove os trechos sem fala antes da transcrição.
+
+    Retorna (caminho do áudio a transcrever, mapa de deslocamento). Quando o VAD está desativado
+    ou a economia fica abaixo de min_saving_ratio, retorna (audio_path, None). O áudio recortado é
+    codificado com output_params (codec, sample_rate, bitrate) e fica em cache no diretório
+    temporário, junto do mapa, indexado por caminho, tamanho, mtime e parâmetros.
+    """
+    params = vad_params(settings)
+    if not params["enabled"]:
+        return audio_path, None
+
+    stat = os.stat(audio_path)
+    cache_name = hash_params({"path": os.path.abspath(audio_path), "size": stat.st_size, "mtime": stat.st_mtime,
+                              "vad": params, "output": output_params})
+    extension = ".ogg" if output_params["codec"] == "opus" else ".mp3"
+    vad_directory = os.path.join(load_settings().get("default_temp_directory", "temp"), "transcription_vad")
+    trimmed_path = os.path.join(vad_directory, cache_name + extension)
+    map_path = os.path.join(vad_directory, cache_name + ".json")
+    if os.path.exists(map_path):
+        with open(map_path, "r", encoding="utf-8") as f:
+            offset_map = [tuple(entry) for entry in json.load(f)]
+        return (trimmed_path, offset_map) if offset_map else (audio_path, None)
+
+    speech, total_duration = detect_speech(audio_path, params)
+    speech_duration = sum(end - start for start, end in speech)
+    os.makedirs(vad_directory, exist_ok=True)
+
+    if not speech or total_duration - speech_duration < total_duration * params["min_saving_ratio"]:
+        # Pouco silêncio a cortar: grava um mapa vazio para não repetir a análise
+        with open(map_path, "w", encoding="utf-8") as f:
+            json.dump([], f)
+        return audio_path, None
+
+    # As expressões do aselect vão para um script de filtro, pois podem ser milhares de trechos
+    filter_path = os.path.join(vad_directory, cache_name + ".filter")
+    with open(filter_path, "w", encoding="utf-8") as f:
+        expression = "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end in speech)
+        f.write(f"aselect='{expression}',asetpts=N/SR/TB")
+
+    codec_args = ["-c:a", "libopus", "-application", "voip"] if output_params["codec"] == "opus" else ["-c:a", "libmp3lame"]
+    partial_path = trimmed_path + ".partial" + extension
+    command = [
+        "ffmpeg", "-y", "-loglevel", "error", "-i", audio_path, "-vn", "-filter_script:a", filter_path,
+        "-ac", "1", "-ar", str(output_params["sample_rate"]), *codec_args, "-b:a", output_params["bitrate"],
+        partial_path
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, stdin=subprocess.DEVNULL)
+    finally:
+        os.remove(filter_path)
+    if result.returncode != 0:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise RuntimeError(f"ffmpeg failed to trim silence from {audio_path}: {result.stderr.strip()}")
+    os.replace(partial_path, trimmed_path)
+
+    offset_map = build_offset_map(speech)
+    # O mapa é gravado por último: sua presença indica que o áudio recortado está completo
+    with open(map_path, "w", encoding="utf-8") as f:
+        json.dump(offset_map, f)
+
+    removed = total_duration - speech_duration
+    logger.info(f"VAD trimmed {removed:.1f}s of {total_duration:.1f}s ({removed / total_duration:.0%}) of non-speech from {os.path.basename(audio_path)}")
+    return trimmed_path, offset_map
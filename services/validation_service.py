@@ -1,23 +1,23 @@
 # services/validation_service.py
 
 import anthropic
-from services.security_service import load_api_keys
+from services.client_service import get_anthropic_client, get_api_key
+from services.routing_service import route_prompt
 from utils.logger import logger
 
 def test_anthropic_api() -> (bool, str):
     """Testa a conexão com a API da Anthropic (Claude)."""
-    keys = load_api_keys()
-    api_key = keys.get("anthropic_api_key")
+    api_key = get_api_key("anthropic_api_key")
 
     if not api_key or api_key == "your-key-here":
         logger.warning("Anthropic API key not set or is default. Skipping test.")
         return False, "API key not set."
 
     try:
-        client = anthropic.Anthropic(api_key=api_key, timeout=10.0)
+        client = get_anthropic_client().with_options(timeout=10.0)
         # Envia uma mensagem simples e de baixo custo para testar a autenticação
         client.messages.create(
-            model="claude-3-haiku-20240307",
+            model=route_prompt("validation", "Hello", 10),
             max_tokens=10,
             messages=[{"role": "user", "content": "Hello"}]
         )
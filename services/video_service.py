@@ -1,13 +1,26 @@
 # services/video_service.py
 
+import json
 import os
 import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn
+from services.discovery_service import discover_course
+from services.probe_service import probe_media
+from utils.config import get_setting
+from utils.database import get_db_connection
+from utils.hashing import hash_file, hash_params
 from utils.logger import logger
 
 console = Console()
 
+# Parâmetros de codificação; fazem parte da chave do manifesto de conversão
+ENCODE_PARAMS = {"codec": "libmp3lame", "sample_rate": 44100, "bitrate": "128k"}
+
 def create_progress_bar(description: str = "Processing"):
     """Cria barra de progresso padrão"""
     return Progress(
@@ -19,88 +32,349 @@ def create_progress_bar(description: str = "Processing"):
         transient=False
     )
 
-def convert_video_to_audio(video_path: str, output_audio_path: str, progress: Progress = None, task_id = None):
-    """Converte um arquivo de vídeo para MP3 128kbps usando ffmpeg."""
-    command = [
-        "ffmpeg",
-        "-i", video_path,
-        "-vn",  # No video
-        "-ar", "44100",  # Audio sample rate
-        "-acodec", "libmp3lame",  # MP3 codec
-        "-b:a", "128k",  # Audio bitrate
-        output_audio_path
-    ]
+def _resolve_worker_limits(max_workers: int = None) -> (int, int):
+    """Calcula o número de workers e o limite de threads do ffmpeg por processo."""
+    cpu_count = os.cpu_count() or 1
+    workers = max_workers or get_setting("video_conversion", "max_workers", 0) or cpu_count
+    workers = max(1, int(workers))
+    # Divide os núcleos entre os workers para não sobrecarregar a CPU
+    threads = get_setting("video_conversion", "ffmpeg_threads", 0) or max(1, cpu_count // workers)
+    return workers, int(threads)
+
+def _is_conversion_up_to_date(video_path: str, output_audio_path: str, params_hash: str, use_content_hash: bool, size: int = None, mtime: float = None) -> dict:
+    """Consulta o manifesto; retorna as saídas já convertidas com os mesmos parâmetros, ou None.
+
+    A extensão registrada pode diferir de output_audio_path quando a conversão usou o remux para M4A.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT size, mtime, content_hash, params_hash, output_path, outputs_json FROM conversion_manifest WHERE source_path = ?",
+                   (os.path.abspath(video_path),))
+    entry = cursor.fetchone()
+    conn.close()
 
+    if entry is None or entry['params_hash'] != params_hash:
+        return None
+    outputs = {"audio": entry['output_path'], **json.loads(entry['outputs_json'] or "{}")}
+    if os.path.splitext(outputs["audio"])[0] != os.path.splitext(os.path.abspath(output_audio_path))[0]:
+        return None
+    if not all(os.path.exists(path) for path in outputs.values() if path):
+        return None
+
+    if size is None or mtime is None:
+        stat = os.stat(video_path)
+        size, mtime = stat.st_size, stat.st_mtime
+    if entry['size'] == size and entry['mtime'] == mtime:
+        return outputs
+    # Tamanho/mtime mudaram (ex: cópia ou touch): o hash do conteúdo decide, se habilitado
+    if use_content_hash and entry['content_hash'] and entry['size'] == size:
+        if hash_file(video_path) == entry['content_hash']:
+            _record_conversion(video_path, outputs, params_hash, entry['content_hash'])
+            return outputs
+    return None
+
+def _record_conversion(video_path: str, outputs: dict, params_hash: str, content_hash: str = None):
+    """Registra no manifesto uma conversão concluída e todas as saídas geradas."""
+    stat = os.stat(video_path)
+    extra_outputs = {name: os.path.abspath(path) for name, path in outputs.items() if name != "audio" and path}
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT OR REPLACE INTO conversion_manifest (source_path, size, mtime, content_hash, params_hash, output_path, outputs_json) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (os.path.abspath(video_path), stat.st_size, stat.st_mtime, content_hash, params_hash, os.path.abspath(outputs["audio"]), json.dumps(extra_outputs))
+    )
+    conn.commit()
+    conn.close()
+
+def _remux_policy() -> dict:
+    """Política do remux (cópia direta da faixa de áudio), definida em settings.json."""
+    policy = {"enabled": True, "codecs": ["mp3", "aac"], "min_bitrate_kbps": 96, "max_bitrate_kbps": 320}
+    policy.update(get_setting("video_conversion", "remux", {}))
+    return policy
+
+def _remux_extension(media_info: dict, policy: dict) -> str:
+    """Retorna a extensão do contêiner para copiar o áudio sem recodificar, ou None se for preciso recodificar."""
+    codec = media_info.get("codec")
+    bitrate = media_info.get("bit_rate")
+    if not policy["enabled"] or codec not in policy["codecs"] or not bitrate:
+        return None
+    if not policy["min_bitrate_kbps"] * 1000 <= bitrate <= policy["max_bitrate_kbps"] * 1000:
+        return None
+    return {"mp3": ".mp3", "aac": ".m4a"}.get(codec)
+
+def _parse_speed(value: str) -> float:
+    """Converte o campo speed do ffmpeg (ex: '12.3x') em float."""
     try:
-        # Cria o diretório de saída se não existir
-        os.makedirs(os.path.dirname(output_audio_path), exist_ok=True)
+        return float(value.strip().rstrip("x"))
+    except ValueError:
+        return 0.0
+
+def run_ffmpeg_with_progress(command: list, duration: float = 0.0, on_progress = None) -> (bool, dict):
+    """Executa o ffmpeg em modo -progress, interpretando a saída conforme ela chega.
+
+    on_progress recebe um dict com percent, speed (x tempo real), bytes_written e out_time
+    a cada bloco de progresso. Retorna (sucesso, métricas) ou (False, mensagem de erro).
+    """
+    command = [command[0], "-progress", "pipe:1", "-nostats", "-loglevel", "error"] + command[1:]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL,
+                               universal_newlines=True, bufsize=1)
+
+    # Guarda apenas as últimas linhas de erro, drenadas em paralelo para evitar deadlock no pipe
+    stderr_tail = deque(maxlen=20)
+    stderr_reader = threading.Thread(target=lambda: stderr_tail.extend(process.stderr), daemon=True)
+    stderr_reader.start()
+
+    started_at = time.monotonic()
+    stats = {"percent": 0.0, "speed": 0.0, "bytes_written": 0, "out_time": 0.0}
+    block = {}
+    for line in process.stdout:
+        key, _, value = line.strip().partition("=")
+        if key != "progress":
+            block[key] = value
+            continue
+
+        out_time_us = block.get("out_time_us") or block.get("out_time_ms")
+        if out_time_us and out_time_us.lstrip("-").isdigit():
+            stats["out_time"] = max(0.0, int(out_time_us) / 1_000_000)
+        if block.get("total_size", "").isdigit():
+            stats["bytes_written"] = int(block["total_size"])
+        stats["speed"] = _parse_speed(block.get("speed", "")) or stats["speed"]
+        if duration:
+            stats["percent"] = min(100.0, stats["out_time"] / duration * 100)
+        if value == "end":
+            stats["percent"] = 100.0
+        block = {}
+        if on_progress:
+            on_progress(dict(stats))
+
+    process.wait()
+    stderr_reader.join()
+
+    if process.returncode != 0:
+        return False, "".join(stderr_tail).strip() or f"ffmpeg exited with code {process.returncode}"
+
+    elapsed = time.monotonic() - started_at
+    metrics = {
+        "duration": duration,
+        "elapsed": elapsed,
+        "speed": (duration / elapsed) if duration and elapsed else stats["speed"],
+        "bytes_written": stats["bytes_written"],
+    }
+    return True, metrics
+
+def _transcription_audio_params() -> dict:
+    """Parâmetros da saída de áudio para transcrição (mono, baixa taxa), definidos em settings.json."""
+    params = {"enabled": True, "sample_rate": 16000, "bitrate": "32k"}
+    params.update(get_setting("video_conversion", "transcription_audio", {}))
+    return params
+
+def convert_video_to_audio(video_path: str, output_audio_path: str, progress: Progress = None, task_id = None, threads: int = None,
+                           transcription_audio_path: str = None, cover_path: str = None) -> (bool, dict):
+    """Converte um arquivo de vídeo para MP3 128kbps usando ffmpeg.
+
+    Se a faixa de áudio já for MP3/AAC dentro da política de remux, ela é copiada sem
+    recodificar (AAC vai para .m4a). Na mesma invocação (um único demux/decode) podem ser
+    gerados também o áudio para transcrição (16kHz mono) e um frame de capa.
+    Retorna (True, métricas, incluindo output_path, transcription_audio_path, cover_path e mode)
+    ou (False, mensagem de erro).
+    """
+    media_info = probe_media(video_path) or {"duration": 0.0}
+    remux_extension = _remux_extension(media_info, _remux_policy())
+    thread_args = ["-threads", str(threads)] if threads else []
+
+    command = ["ffmpeg", "-y", "-i", video_path, "-map", "0:a:0", "-vn"]
+    if remux_extension:
+        output_audio_path = os.path.splitext(output_audio_path)[0] + remux_extension
+        command += ["-c:a", "copy"]
+        if remux_extension == ".m4a":
+            command += ["-movflags", "+faststart"]
+    else:
+        command += [
+            "-ar", str(ENCODE_PARAMS["sample_rate"]),  # Audio sample rate
+            "-acodec", ENCODE_PARAMS["codec"],  # MP3 codec
+            "-b:a", ENCODE_PARAMS["bitrate"],  # Audio bitrate
+        ] + thread_args
+    command.append(output_audio_path)
 
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
-        
-        # Simula progresso (ffmpeg não dá progresso fácil para stdout/stderr)
+    if transcription_audio_path:
+        transcription_params = _transcription_audio_params()
+        command += [
+            "-map", "0:a:0", "-vn",
+            "-ac", "1",
+            "-ar", str(transcription_params["sample_rate"]),
+            "-acodec", "libmp3lame",
+            "-b:a", transcription_params["bitrate"],
+        ] + thread_args + [transcription_audio_path]
+
+    if cover_path and not media_info.get("has_video"):
+        # Uma saída sem nenhuma faixa faria o ffmpeg abortar a conversão inteira
+        logger.info(f"No video stream in {os.path.basename(video_path)}; skipping cover frame.")
+        cover_path = None
+    if cover_path:
+        command += ["-map", "0:v:0", "-an", "-frames:v", "1", "-q:v", "2", cover_path]
+
+    file_name = os.path.basename(video_path)
+
+    def _on_progress(stats: dict):
         if progress and task_id is not None:
-            progress.update(task_id, description=f"Converting [bright_white]{os.path.basename(video_path)}[/]...")
-            # Para uma barra de progresso mais precisa, precisaríamos parsear a saída do ffmpeg
-            # Por enquanto, uma simulação simples ou um spinner é suficiente.
-            # A barra de progresso será atualizada pelo chamador se for uma operação longa.
-            progress.update(task_id, advance=100) # Completa a tarefa imediatamente para este exemplo
+            progress.update(
+                task_id,
+                completed=stats["percent"],
+                description=f"[bright_white]{file_name}[/] {stats['speed']:.1f}x {stats['bytes_written'] / (1024 * 1024):.1f} MB"
+            )
+
+    try:
+        # Cria os diretórios de saída se não existirem
+        for path in (output_audio_path, transcription_audio_path, cover_path):
+            if path:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
 
-        stdout, stderr = process.communicate()
+        if progress and task_id is not None:
+            progress.update(task_id, total=100, completed=0, description=f"Converting [bright_white]{file_name}[/]...")
 
-        if process.returncode != 0:
-            logger.error(f"FFmpeg error converting {video_path}: {stdout}")
-            raise Exception(f"FFmpeg error: {stdout}")
+        success, result = run_ffmpeg_with_progress(command, media_info["duration"], _on_progress)
+        if not success:
+            logger.error(f"FFmpeg error converting {video_path}: {result}")
+            raise Exception(f"FFmpeg error: {result}")
 
-        logger.info(f"Successfully converted: {os.path.basename(video_path)}")
-        return True
+        result["output_path"] = output_audio_path
+        result["transcription_audio_path"] = transcription_audio_path
+        result["cover_path"] = cover_path if cover_path and os.path.exists(cover_path) else None
+        result["mode"] = "remux" if remux_extension else "encode"
+        logger.info(f"Successfully converted ({result['mode']}): {file_name} ({result['speed']:.1f}x realtime, {result['bytes_written']} bytes in {result['elapsed']:.1f}s)")
+        return True, result
     except FileNotFoundError:
         logger.error("ffmpeg not found. Please install ffmpeg and add it to your PATH.")
         console.print("[bright_red]✗ Error: ffmpeg not found. Please install ffmpeg and add it to your PATH.[/]")
-        return False
+        return False, "ffmpeg not found."
     except Exception as e:
         logger.error(f"Error converting {video_path}: {e}")
-        console.print(f"[bright_red]✗ Error converting {os.path.basename(video_path)}: {e}[/]")
-        return False
+        console.print(f"[bright_red]✗ Error converting {file_name}: {e}[/]")
+        return False, str(e)
+
+def _record_conversion_metrics(video_path: str, metrics: dict):
+    """Registra as métricas de throughput de uma conversão, para identificar fontes lentas e regressões."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO conversion_metrics (source_path, duration_seconds, elapsed_seconds, speed, bytes_written) VALUES (?, ?, ?, ?, ?)",
+        (os.path.abspath(video_path), metrics["duration"], metrics["elapsed"], metrics["speed"], metrics["bytes_written"])
+    )
+    conn.commit()
+    conn.close()
+
+def process_course_videos_to_audio(course_directory: str, output_base_directory: str, max_workers: int = None, force: bool = False,
+                                   transcription_directory: str = None, cover_directory: str = None, lessons: list = None,
+                                   progress: Progress = None, task_id = None) -> (bool, list):
+    """Processa todos os vídeos em um diretório de curso para áudio, mantendo a hierarquia.
+
+    As conversões rodam em um pool limitado de workers; vídeos que não mudaram desde a última
+    conversão (segundo o manifesto) são pulados, a menos que force=True. Se transcription_directory
+    e/ou cover_directory forem informados, o áudio para transcrição e a capa de cada aula são
+    gerados na mesma passada do ffmpeg, com a mesma hierarquia. lessons é o índice do
+    discovery_service; se omitido, a árvore do curso é percorrida aqui (uma única vez).
 
-def process_course_videos_to_audio(course_directory: str, output_base_directory: str):
-    """Processa todos os vídeos em um diretório de curso para áudio, mantendo a hierarquia."""
-    video_extensions = (".mp4", ".avi", ".mkv", ".mov")
-    processed_count = 0
-    total_videos = 0
+    Retorna, em ordem, um dict por aula: source, audio, transcription_audio e cover.
+    """
+    if transcription_directory and not _transcription_audio_params()["enabled"]:
+        transcription_directory = None
 
-    # Contar total de vídeos para a barra de progresso
-    for root, _, files in os.walk(course_directory):
-        for file in files:
-            if file.lower().endswith(video_extensions):
-                total_videos += 1
+    if lessons is None:
+        lessons = discover_course(course_directory)
+
+    jobs = []
+    for lesson in lessons:
+        # Mantém a hierarquia relativa do curso nas saídas
+        output_sub_dir = os.path.dirname(lesson["relative_path"])
+        output_stem = os.path.splitext(os.path.basename(lesson["relative_path"]))[0]
+        jobs.append({
+            "source": lesson["path"],
+            "size": lesson["size"],
+            "mtime": lesson["mtime"],
+            "audio": os.path.join(output_base_directory, output_sub_dir, output_stem + ".mp3"),
+            "transcription_audio": os.path.join(transcription_directory, output_sub_dir, output_stem + ".mp3") if transcription_directory else None,
+            "cover": os.path.join(cover_directory, output_sub_dir, output_stem + ".jpg") if cover_directory else None,
+        })
+    total_videos = len(jobs)
 
     if total_videos == 0:
         logger.warning(f"No videos found in {course_directory}")
         console.print(f"[bright_yellow]No videos found in {course_directory}[/]")
-        return
-
-    with create_progress_bar("Converting videos to audio") as progress:
-        main_task = progress.add_task("Overall Progress", total=total_videos)
-
-        for root, _, files in os.walk(course_directory):
-            for file in files:
-                if file.lower().endswith(video_extensions):
-                    video_path = os.path.join(root, file)
-                    
-                    # Calcula o caminho relativo para manter a hierarquia
-                    relative_path = os.path.relpath(video_path, course_directory)
-                    output_sub_dir = os.path.dirname(relative_path)
-                    output_filename = os.path.splitext(os.path.basename(file))[0] + ".mp3"
-                    
-                    output_audio_path = os.path.join(output_base_directory, output_sub_dir, output_filename)
-
-                    if convert_video_to_audio(video_path, output_audio_path, progress, main_task):
-                        processed_count += 1
-                    progress.update(main_task, advance=1)
-
-        progress.update(main_task, completed=total_videos, description="Conversion Complete")
-        logger.info(f"Finished converting {processed_count} of {total_videos} videos to audio.")
-        console.print(f"\n[bright_green]✅ Finished converting {processed_count} of {total_videos} videos to audio.[/]")
+        return False, f"No videos found in {course_directory}"
+
+    params_hash = hash_params({
+        **ENCODE_PARAMS,
+        "remux": _remux_policy(),
+        "transcription_audio": _transcription_audio_params() if transcription_directory else None,
+        "cover": bool(cover_directory),
+    })
+    use_content_hash = get_setting("video_conversion", "hash_content", False)
+
+    produced_outputs = [None] * total_videos
+    pending = []
+    for index, job in enumerate(jobs):
+        outputs = None if force else _is_conversion_up_to_date(job["source"], job["audio"], params_hash, use_content_hash, job["size"], job["mtime"])
+        if outputs:
+            produced_outputs[index] = {"source": job["source"], "transcription_audio": None, "cover": None, **outputs}
+        else:
+            pending.append(index)
+
+    skipped_count = total_videos - len(pending)
+    if skipped_count:
+        logger.info(f"Skipping {skipped_count} of {total_videos} videos already converted (manifest up to date).")
+
+    workers, threads = _resolve_worker_limits(max_workers)
+    workers = max(1, min(workers, len(pending)))
+    logger.info(f"Converting {len(pending)} videos with {workers} workers ({threads} ffmpeg threads each).")
+
+    def _run(main_progress: Progress, main_task):
+        def _convert_job(index: int) -> (bool, dict):
+            # Cada worker ganha sua própria linha de progresso enquanto converte
+            job = jobs[index]
+            file_task = main_progress.add_task("Queued", total=100)
+            try:
+                return convert_video_to_audio(job["source"], job["audio"], main_progress, file_task, threads=threads,
+                                              transcription_audio_path=job["transcription_audio"], cover_path=job["cover"])
+            finally:
+                main_progress.remove_task(file_task)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_convert_job, index): index for index in pending}
+            for future in as_completed(futures):
+                index = futures[future]
+                video_path = jobs[index]["source"]
+                success, result = future.result()
+                if success:
+                    outputs = {
+                        "audio": result["output_path"],
+                        "transcription_audio": result["transcription_audio_path"],
+                        "cover": result["cover_path"],
+                    }
+                    produced_outputs[index] = {"source": video_path, **outputs}
+                    content_hash = hash_file(video_path) if use_content_hash else None
+                    _record_conversion(video_path, outputs, params_hash, content_hash)
+                    _record_conversion_metrics(video_path, result)
+                main_progress.update(main_task, advance=1, description=f"Converted [bright_white]{os.path.basename(video_path)}[/]")
+
+    if progress and task_id is not None:
+        # Reaproveita a barra do chamador: uma tarefa própria para a conversão
+        conversion_task = progress.add_task("Converting videos to audio", total=total_videos, completed=skipped_count)
+        _run(progress, conversion_task)
+        progress.update(conversion_task, completed=total_videos, description="Conversion Complete", visible=False)
+    else:
+        with create_progress_bar("Converting videos to audio") as own_progress:
+            main_task = own_progress.add_task("Overall Progress", total=total_videos, completed=skipped_count)
+            _run(own_progress, main_task)
+            own_progress.update(main_task, completed=total_videos, description="Conversion Complete")
+
+    produced_outputs = [outputs for outputs in produced_outputs if outputs]
+    processed_count = len(produced_outputs)
+    logger.info(f"Finished converting {processed_count} of {total_videos} videos to audio.")
+    console.print(f"\n[bright_green]✅ Finished converting {processed_count} of {total_videos} videos to audio.[/]")
+
+    if processed_count < total_videos:
+        return False, f"Failed to convert {total_videos - processed_count} of {total_videos} videos."
+    return True, produced_outputs
 
 # Exemplo de uso (para testes)
 if __name__ == "__main__":
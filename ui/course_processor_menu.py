@@ -28,6 +28,7 @@ def get_course_processor_menu_content() -> str:
 [bright_blue][2][/] [bright_white]Convert Courses to Audio[/]
 [bright_blue][3][/] [bright_white]Transcribe Audio Files[/]
 [bright_blue][4][/] [bright_white]Generate AI Course Summaries[/]
+[bright_blue][14][/] [bright_white]Batch Summarize Pending Courses[/] [dim white](overnight, Message Batches API)[/]
 [bright_blue][5][/] [bright_white]Create Unified Audio[/]
 [bright_blue][6][/] [bright_white]Generate Timestamps Only[/]
 [bright_blue][7][/] [bright_white]Generate Course TTS Audio Notes[/]
@@ -102,7 +103,7 @@ from services.tts_service import generate_tts_audio
 from services.gdrive_service import upload_file_to_drive
 from services.rss_service import update_rss_feed
 from services.github_service import update_github_repo
-from services.course_processor_service import process_complete_course
+from services.course_processor_service import process_complete_course, summarize_pending_courses_batch
 from utils.database import get_db_connection
 from rich.table import Table
 from rich.box import ROUNDED
@@ -153,8 +154,8 @@ def show_course_processor_menu():
         panel = create_menu_panel(content, "Course Processor Options")
         console.print(panel)
 
-        choice = get_menu_choice("Select option", 13)
-        result = handle_menu_navigation(choice, 13)
+        choice = get_menu_choice("Select option", 14)
+        result = handle_menu_navigation(choice, 14)
 
         if result == "back":
             break
@@ -302,6 +303,16 @@ def show_course_processor_menu():
             forget_course()
         elif result == 13: # Clear All Data
             clear_all_data()
+        elif result == 14: # Batch Summarize Pending Courses
+            prompt_name = safe_input("Enter the prompt name (default: summary_test): ") or "summary_test"
+            # Sem timeout: o lote pode levar horas; um lote interrompido é recolhido na próxima execução
+            with console.status("[bold blue]Waiting for the summary batch...[/]"):
+                success, message = summarize_pending_courses_batch(prompt_name)
+            if success:
+                console.print(f"[bright_green]{message}[/]")
+            else:
+                console.print(f"[bright_red]Batch summary error:[/] {message}")
+            time.sleep(2)
         else:
             console.print(f"[bold bright_yellow]Option {result} is not yet implemented.[/]")
             time.sleep(1.5)
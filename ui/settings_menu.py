@@ -8,6 +8,8 @@ from rich.box import ROUNDED
 
 from ui.utils import create_menu_panel, get_menu_choice, handle_menu_navigation
 from services.security_service import load_api_keys, save_api_keys
+from services.ai_service import clear_llm_cache, get_llm_cache_stats
+from services.transcription_service import get_transcription_cache_stats, invalidate_transcription_cache
 
 console = Console()
 
@@ -114,6 +116,54 @@ def show_api_keys_menu():
             time.sleep(1.5)
 
 
+def show_cleanup_menu():
+    """Mostra o estado dos caches de transcrição e de respostas de LLM e permite limpá-los."""
+    while True:
+        render_submenu_header("CLEANUP TOOLS", "🧹")
+
+        transcription_stats = get_transcription_cache_stats()
+        llm_stats = get_llm_cache_stats()
+
+        table = Table(title="[bold bright_blue]Cache Status[/]", box=ROUNDED)
+        table.add_column("Cache", style="bright_white")
+        table.add_column("Entries", style="white", justify="right")
+        table.add_column("Total Hits", style="white", justify="right")
+        table.add_column("Session Hit Rate", style="white", justify="right")
+
+        for cache_name, stats in (("Transcriptions", transcription_stats), ("LLM Responses", llm_stats)):
+            lookups = stats["session_hits"] + stats["session_misses"]
+            table.add_row(cache_name, str(stats["entries"]), str(stats["total_hits"]),
+                          f"{stats['hit_rate']:.0%} ({stats['session_hits']}/{lookups})" if lookups else "-")
+
+        console.print(table)
+        console.print(f"[dim white]LLM responses use {llm_stats['size_bytes'] / 1024:.1f} KB.[/]")
+
+        content = """
+[bright_blue][1][/] [bright_white]Clear Transcription Cache[/]
+[bright_blue][2][/] [bright_white]Clear LLM Response Cache[/]
+[bright_blue][0][/] [bright_white]Back to Settings[/]
+"""
+        panel = create_menu_panel(content, "Cleanup Options")
+        console.print(panel)
+
+        choice = get_menu_choice("Select option", 2)
+        result = handle_menu_navigation(choice, 2)
+
+        if result == "back":
+            break
+        elif result == "invalid":
+            time.sleep(1)
+            continue
+        elif result == 1:
+            removed = invalidate_transcription_cache()
+            console.print(f"[bright_green]✓ Removed {removed} cached transcriptions.[/]")
+            time.sleep(1.5)
+        elif result == 2:
+            removed = clear_llm_cache()
+            console.print(f"[bright_green]✓ Removed {removed} cached LLM responses.[/]")
+            time.sleep(1.5)
+
+
 def get_settings_menu_content() -> str:
     """Retorna o conteúdo do painel do menu de configurações."""
     return """
@@ -148,6 +198,8 @@ def show_settings_menu():
             continue
         elif result == 1:
             show_api_keys_menu()
+        elif result == 5:
+            show_cleanup_menu()
         else:
             console.print(f"[bold bright_yellow]Option {result} is not yet implemented.[/]")
             time.sleep(1.5)
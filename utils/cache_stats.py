@@ -0,0 +1,25 @@
+# utils/cache_stats.py
+
+import threading
+
+class HitCounter:
+    """Contadores de acerto e falha de um cache na sessão atual, seguros entre threads."""
+
+    def __init__(self):
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+    def snapshot(self) -> dict:
+        """Retorna session_hits, session_misses e hit_rate (0.0 sem consultas)."""
+        with self._lock:
+            hits, misses = self._hits, self._misses
+        lookups = hits + misses
+        return {"session_hits": hits, "session_misses": misses, "hit_rate": hits / lookups if lookups else 0.0}
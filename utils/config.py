@@ -0,0 +1,25 @@
+# utils/config.py
+
+import json
+import os
+from utils.logger import logger
+
+SETTINGS_FILE = os.path.join("config", "settings.json")
+
+def load_settings() -> dict:
+    """Carrega as configurações do arquivo settings.json."""
+    if not os.path.exists(SETTINGS_FILE):
+        logger.warning(f"Settings file not found: {SETTINGS_FILE}. Using defaults.")
+        return {}
+
+    try:
+        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError as e:
+        logger.error(f"Error decoding settings JSON: {e}. Using defaults.")
+        return {}
+
+def get_setting(section: str, key: str, default=None):
+    """Retorna um valor de uma seção do settings.json, ou o default se não existir."""
+    value = load_settings().get(section, {}).get(key)
+    return default if value is None else value
@@ -13,11 +13,11 @@ def get_db_connection():
 def initialize_database():
     """Cria as tabelas do banco de dados se elas não existirem."""
     if os.path.exists(DB_FILE):
-        logger.info("Database already exists. Skipping initialization.")
-        return
-
-    logger.info("Initializing database...")
-    os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
+        # As tabelas usam IF NOT EXISTS: apenas garante as que foram adicionadas depois
+        logger.info("Database already exists. Ensuring all tables are present.")
+    else:
+        logger.info("Initializing database...")
+        os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
     
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -62,6 +62,117 @@ def initialize_database():
     """
     )
 
+    # Manifesto de conversão: evita recodificar vídeos que não mudaram
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS conversion_manifest (
+        source_path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        content_hash TEXT,
+        params_hash TEXT NOT NULL,
+        output_path TEXT NOT NULL,
+        outputs_json TEXT,
+        converted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    )
+
+    # Métricas de throughput por arquivo convertido
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS conversion_metrics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source_path TEXT NOT NULL,
+        duration_seconds REAL,
+        elapsed_seconds REAL,
+        speed REAL,
+        bytes_written INTEGER,
+        recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    )
+
+    # Cache de metadados do ffprobe (duração, codec, bitrate...)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS media_probe (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        probe_json TEXT NOT NULL,
+        probed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    )
+
+    # Cache de transcrições por conteúdo do áudio + parâmetros do modelo
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS transcription_cache (
+        cache_key TEXT PRIMARY KEY,
+        audio_hash TEXT NOT NULL,
+        model TEXT NOT NULL,
+        language TEXT,
+        result_json TEXT NOT NULL,
+        hit_count INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_used_at TIMESTAMP
+    );
+    """
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transcription_cache_audio ON transcription_cache (audio_hash);")
+
+    # Cache de respostas de LLM por prompt, modelo, parâmetros e entrada
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS llm_cache (
+        cache_key TEXT PRIMARY KEY,
+        model TEXT NOT NULL,
+        response_text TEXT NOT NULL,
+        size_bytes INTEGER NOT NULL,
+        hit_count INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used_at);")
+
+    # Métricas de latência das gerações em streaming (tempo até o primeiro token e tokens/s)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS llm_metrics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        model TEXT NOT NULL,
+        prompt_name TEXT,
+        ttft_seconds REAL,
+        elapsed_seconds REAL,
+        output_tokens INTEGER,
+        tokens_per_second REAL,
+        cancelled INTEGER DEFAULT 0,
+        recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    )
+
+    # Lotes da Message Batches API e suas requisições (custom_id -> chave do cache de respostas)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS summary_batches (
+        batch_id TEXT PRIMARY KEY,
+        prompt_name TEXT NOT NULL,
+        model TEXT NOT NULL,
+        status TEXT NOT NULL,
+        request_count INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        completed_at TIMESTAMP
+    );
+    """
+    )
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS summary_batch_items (
+        batch_id TEXT NOT NULL REFERENCES summary_batches(batch_id),
+        custom_id TEXT NOT NULL,
+        cache_key TEXT NOT NULL,
+        PRIMARY KEY (batch_id, custom_id)
+    );
+    """
+    )
+
     conn.commit()
     conn.close()
     logger.info("Database initialized successfully.")
@@ -0,0 +1,22 @@
+# utils/hashing.py
+
+import hashlib
+import json
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def hash_file(path: str, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """Calcula o SHA-256 do conteúdo de um arquivo, lendo em blocos."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_params(params: dict) -> str:
+    """Gera um hash estável para um dicionário de parâmetros."""
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+def hash_text(text: str) -> str:
+    """Calcula o SHA-256 de um texto (UTF-8)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
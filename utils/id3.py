@@ -0,0 +1,136 @@
+# utils/id3.py
+
+import os
+import shutil
+import struct
+import tempfile
+
+ID3_HEADER_SIZE = 10
+CHAPTER_FRAME_IDS = (b"CHAP", b"CTOC")
+# O CTOC guarda a quantidade de entradas em um único byte
+MAX_TOC_ENTRIES = 255
+DEFAULT_PADDING = 4096
+
+def _syncsafe_to_int(data: bytes) -> int:
+    """Decodifica um inteiro syncsafe de 4 bytes (7 bits por byte)."""
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+def _int_to_syncsafe(value: int) -> bytes:
+    """Codifica um inteiro como syncsafe de 4 bytes."""
+    return bytes([(value >> 21) & 0x7F, (value >> 14) & 0x7F, (value >> 7) & 0x7F, value & 0x7F])
+
+def _frame(frame_id: bytes, payload: bytes, version: int) -> bytes:
+    """Monta um frame ID3v2 (cabeçalho + conteúdo) para a versão 3 ou 4."""
+    size = _int_to_syncsafe(len(payload)) if version == 4 else struct.pack(">I", len(payload))
+    return frame_id + size + b"\x00\x00" + payload
+
+def _text_frame(frame_id: bytes, text: str, version: int) -> bytes:
+    """Monta um frame de texto (ex: TIT2); UTF-8 na v2.4, UTF-16 com BOM na v2.3."""
+    if version == 4:
+        return _frame(frame_id, b"\x03" + text.encode("utf-8"), version)
+    return _frame(frame_id, b"\x01" + text.encode("utf-16"), version)
+
+def _read_tag(f) -> (int, int, int, bytes):
+    """Lê o tag ID3v2 no início do arquivo.
+
+    Retorna (versão, tamanho total ocupado pelo tag, espaço disponível para reescrita no lugar,
+    frames existentes que não são de capítulo), ou (None, 0, 0, b"") se o arquivo não tiver tag.
+    """
+    header = f.read(ID3_HEADER_SIZE)
+    if len(header) < ID3_HEADER_SIZE or header[:3] != b"ID3":
+        return None, 0, 0, b""
+
+    version, flags = header[3], header[5]
+    tag_size = _syncsafe_to_int(header[6:10])
+    total_size = ID3_HEADER_SIZE + tag_size + (ID3_HEADER_SIZE if flags & 0x10 else 0)
+    # Com rodapé (v2.4) o tag não é reescrito no lugar, pois o novo cabeçalho não o declara
+    capacity = 0 if flags & 0x10 else tag_size
+    if version not in (3, 4):
+        raise ValueError(f"Unsupported ID3v2 version: 2.{version}")
+    if flags & 0x80:
+        raise ValueError("Unsynchronised ID3 tags are not supported.")
+
+    body = f.read(tag_size)
+    position = 0
+    if flags & 0x40:
+        # Pula o cabeçalho estendido
+        extended_size = _syncsafe_to_int(body[:4]) if version == 4 else struct.unpack(">I", body[:4])[0] + 4
+        position = extended_size
+
+    kept_frames = []
+    while position + ID3_HEADER_SIZE <= len(body):
+        frame_id = body[position:position + 4]
+        if frame_id[:1] == b"\x00":
+            break  # Início do padding
+        size_bytes = body[position + 4:position + 8]
+        frame_size = _syncsafe_to_int(size_bytes) if version == 4 else struct.unpack(">I", size_bytes)[0]
+        frame_end = position + ID3_HEADER_SIZE + frame_size
+        if frame_id not in CHAPTER_FRAME_IDS:
+            kept_frames.append(body[position:frame_end])
+        position = frame_end
+    return version, total_size, capacity, b"".join(kept_frames)
+
+def _chapter_frames(chapters: list[dict], version: int, toc_title: str = None) -> bytes:
+    """Monta os frames CHAP de cada capítulo e os frames CTOC que os indexam."""
+    frames = []
+    chapter_ids = []
+    for index, chapter in enumerate(chapters):
+        element_id = f"chp{index}".encode("ascii")
+        chapter_ids.append(element_id)
+        payload = (
+            element_id + b"\x00"
+            + struct.pack(">IIII", int(chapter["start"] * 1000), int(chapter["end"] * 1000), 0xFFFFFFFF, 0xFFFFFFFF)
+            + _text_frame(b"TIT2", chapter["title"], version)
+        )
+        frames.append(_frame(b"CHAP", payload, version))
+
+    def _toc(element_id: bytes, child_ids: list[bytes], top_level: bool, title: str = None) -> bytes:
+        flags = 0x03 if top_level else 0x01  # bit 0: ordenado; bit 1: nível superior
+        payload = element_id + b"\x00" + bytes([flags, len(child_ids)]) + b"".join(child + b"\x00" for child in child_ids)
+        if title:
+            payload += _text_frame(b"TIT2", title, version)
+        return _frame(b"CTOC", payload, version)
+
+    groups = [chapter_ids[i:i + MAX_TOC_ENTRIES] for i in range(0, len(chapter_ids), MAX_TOC_ENTRIES)]
+    if len(groups) <= 1:
+        frames.append(_toc(b"toc", chapter_ids, True, toc_title))
+    else:
+        # Mais de 255 capítulos: um CTOC raiz aponta para CTOCs filhos
+        child_toc_ids = [f"toc{i}".encode("ascii") for i in range(len(groups))]
+        frames.append(_toc(b"toc", child_toc_ids, True, toc_title))
+        frames.extend(_toc(child_id, group, False) for child_id, group in zip(child_toc_ids, groups))
+    return b"".join(frames)
+
+def write_chapters(mp3_path: str, chapters: list[dict], toc_title: str = None, padding: int = DEFAULT_PADDING):
+    """Grava frames ID3v2 CHAP/CTOC no cabeçalho de um MP3, substituindo capítulos existentes.
+
+    chapters é uma lista de dicts com start e end (em segundos) e title. Os demais frames do tag
+    são preservados. Se o tag atual tiver espaço (padding) suficiente, ele é reescrito no lugar,
+    sem tocar no áudio; caso contrário, o payload é copiado byte a byte (sem recodificar) para um
+    novo arquivo com um tag maior, deixando padding para gravações futuras.
+    """
+    with open(mp3_path, "rb") as f:
+        version, old_tag_size, capacity, kept_frames = _read_tag(f)
+    version = version or 3
+
+    body = kept_frames + _chapter_frames(chapters, version, toc_title)
+
+    if capacity and len(body) <= capacity:
+        with open(mp3_path, "r+b") as f:
+            f.write(b"ID3" + bytes([version, 0, 0]) + _int_to_syncsafe(capacity))
+            f.write(body + b"\x00" * (capacity - len(body)))
+        return
+
+    tag_size = len(body) + padding
+    directory = os.path.dirname(os.path.abspath(mp3_path))
+    with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False, suffix=".tmp") as tmp_file:
+        tmp_file.write(b"ID3" + bytes([version, 0, 0]) + _int_to_syncsafe(tag_size))
+        tmp_file.write(body + b"\x00" * padding)
+        with open(mp3_path, "rb") as source:
+            source.seek(old_tag_size)
+            shutil.copyfileobj(source, tmp_file, 1024 * 1024)
+    os.replace(tmp_file.name, mp3_path)
+
+def estimate_chapter_tag_size(chapters: list[dict], toc_title: str = None) -> int:
+    """Estima o tamanho dos frames de capítulo, para reservar padding ao gerar o MP3."""
+    return len(_chapter_frames(chapters, 3, toc_title)) + 1024
@@ -27,7 +27,6 @@ def setup_logging():
     logging.getLogger('httpx').setLevel(logging.WARNING)
     logging.getLogger('httpcore').setLevel(logging.WARNING)
     logging.getLogger('asyncio').setLevel(logging.WARNING)
-    logging.getLogger('pydub').setLevel(logging.WARNING)
     logging.getLogger('git').setLevel(logging.WARNING)
 
     return logging.getLogger('NeuroDeamon')
@@ -0,0 +1,182 @@
+# utils/mock_api_server.py
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.logger import logger
+
+class MockAnthropicServer:
+    """Servidor local que imita a Messages API e a Message Batches API da Anthropic.
+
+    Aponte api_base_urls.anthropic (settings.json) para a url do servidor para exercitar o envio,
+    a consulta e a coleta de lotes sem custo. Cada lote termina após polls_to_end consultas, e o
+    resumo de cada requisição é "Summary of <custom_id>".
+    """
+
+    def __init__(self, polls_to_end: int = 2):
+        self.polls_to_end = polls_to_end
+        self.batches = {}
+        self.messages = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "MockAnthropicServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _batch_json(self, batch_id: str) -> dict:
+        batch = self.batches[batch_id]
+        ended = batch["polls"] >= self.polls_to_end
+        total = len(batch["requests"])
+        return {
+            "id": batch_id, "type": "message_batch", "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {"processing": 0 if ended else total, "succeeded": total if ended else 0, "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": "2024-01-01T00:00:00Z", "expires_at": "2024-01-02T00:00:00Z", "ended_at": None,
+            "archived_at": None, "cancel_initiated_at": None,
+            "results_url": f"{self.url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    @staticmethod
+    def _message_json(model: str, text: str) -> dict:
+        return {"id": "msg_mock", "type": "message", "role": "assistant", "model": model,
+                "content": [{"type": "text", "text": text}], "stop_reason": "end_turn", "stop_sequence": None,
+                "usage": {"input_tokens": 1, "output_tokens": 1}}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug(f"Mock Anthropic API: {format % args}")
+
+            def _send(self, body, content_type: str = "application/json"):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("content-type", content_type)
+                self.send_header("content-length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["content-length"])))
+                path = self.path.split("?")[0]
+                if path == "/v1/messages/batches":
+                    with server._lock:
+                        batch_id = f"msgbatch_mock_{len(server.batches)}"
+                        server.batches[batch_id] = {"requests": payload["requests"], "polls": 0}
+                        self._send(server._batch_json(batch_id))
+                elif path == "/v1/messages":
+                    with server._lock:
+                        server.messages.append(payload)
+                    self._send(server._message_json(payload["model"], f"Summary of {len(payload['messages'][0]['content'])} characters"))
+                else:
+                    self.send_error(404)
+
+            def do_GET(self):
+                parts = self.path.split("?")[0].strip("/").split("/")
+                if len(parts) < 4 or parts[3] not in server.batches:
+                    self.send_error(404)
+                    return
+                batch_id = parts[3]
+                with server._lock:
+                    if parts[-1] == "results":
+                        lines = [
+                            json.dumps({"custom_id": request["custom_id"], "result": {"type": "succeeded",
+                                        "message": server._message_json(request["params"]["model"], f"Summary of {request['custom_id']}")}})
+                            for request in server.batches[batch_id]["requests"]
+                        ]
+                        self._send("\n".join(lines).encode("utf-8"), "application/x-jsonl")
+                    else:
+                        server.batches[batch_id]["polls"] += 1
+                        self._send(server._batch_json(batch_id))
+
+        return Handler
+
+def check_batch_backfill() -> (bool, str):
+    """Exercita o resumo em lote de ponta a ponta contra o servidor local, em um diretório temporário.
+
+    Cobre envio, consulta e coleta, a retomada de um lote deixado aberto (sem reenviar nem pagar
+    de novo) e a deduplicação de linhas repetidas do mesmo curso.
+    """
+    import os
+    import tempfile
+    import utils.config
+    import utils.database
+    import services.ai_service
+    import services.security_service
+    from services.client_service import reset_clients
+    from services.course_processor_service import summarize_pending_courses_batch
+    from services.transcript_service import append_lesson, start_transcript
+
+    server = MockAnthropicServer(polls_to_end=2).start()
+    workspace = tempfile.mkdtemp(prefix="neurodeamon_batch_check_")
+    original_paths = (utils.config.SETTINGS_FILE, utils.database.DB_FILE, services.security_service.API_KEYS_FILE,
+                      services.ai_service.PROMPTS_DIR)
+    try:
+        settings = utils.config.load_settings()
+        settings["api_base_urls"] = {**(settings.get("api_base_urls") or {}), "anthropic": server.url}
+        settings["summary"]["batch"] = {**settings["summary"].get("batch", {}), "poll_interval": 0.05, "max_poll_interval": 0.1}
+        settings["llm_cache"] = {**settings.get("llm_cache", {}), "enabled": False}
+        utils.config.SETTINGS_FILE = os.path.join(workspace, "settings.json")
+        with open(utils.config.SETTINGS_FILE, "w", encoding="utf-8") as f: json.dump(settings, f)
+        utils.database.DB_FILE = os.path.join(workspace, "neurodeamon.db")
+        services.security_service.API_KEYS_FILE = os.path.join(workspace, "api_keys.json")
+        services.security_service.save_api_keys({"anthropic_api_key": "sk-ant-mock"})
+        reset_clients()
+        utils.database.initialize_database()
+
+        services.ai_service.PROMPTS_DIR = os.path.join(workspace, "prompts")
+        os.makedirs(services.ai_service.PROMPTS_DIR)
+        prompt_name = "batch_check"
+        with open(os.path.join(services.ai_service.PROMPTS_DIR, f"{prompt_name}.md"), "w", encoding="utf-8") as f:
+            f.write("Summarize this course:\n\n{{TRANSCRIPTION}}")
+
+        # Dois cursos; o primeiro foi processado duas vezes (linha antiga e linha nova, mesmo diretório)
+        conn = utils.database.get_db_connection()
+        for name, course_directory in (("Course A (failed run)", "a"), ("Course A", "a"), ("Course B", "b")):
+            output_directory = os.path.join(workspace, course_directory)
+            transcript = os.path.join(output_directory, "transcript.jsonl")
+            if not os.path.exists(transcript):
+                start_transcript(transcript)
+                append_lesson(transcript, 0, "Lesson 1", {"text": f"Transcript of {course_directory}.", "segments": []})
+            metadata = {"output_directory": output_directory, "transcript": transcript, "summary": None}
+            conn.execute("INSERT INTO courses (name, directory_path, metadata_json) VALUES (?, ?, ?)",
+                         (name, output_directory, json.dumps(metadata)))
+        conn.commit()
+        conn.close()
+
+        # Primeira execução: o lote é enviado, mas a espera expira (como um programa fechado durante a espera)
+        success, message = summarize_pending_courses_batch(prompt_name, timeout=0)
+        if success or len(server.batches) != 1:
+            return False, f"Expected the first run to time out with one open batch, got ({success}, {message})."
+        submitted = [request["custom_id"] for request in next(iter(server.batches.values()))["requests"]]
+        if len(submitted) != 2:
+            return False, f"Duplicate course rows were submitted: {submitted}"
+
+        # Segunda execução: recolhe o lote aberto sem enviar outro
+        success, message = summarize_pending_courses_batch(prompt_name)
+        if not success:
+            return False, message
+        if len(server.batches) != 1:
+            return False, f"Open batch was resubmitted: {len(server.batches)} batches created."
+        for course_directory in ("a", "b"):
+            with open(os.path.join(workspace, course_directory, "summary.md"), "r", encoding="utf-8") as f:
+                if not f.read().startswith("Summary of course-"):
+                    return False, f"Unexpected summary written for course {course_directory}."
+        return True, f"Batch backfill check passed ({message})"
+    finally:
+        (utils.config.SETTINGS_FILE, utils.database.DB_FILE, services.security_service.API_KEYS_FILE,
+         services.ai_service.PROMPTS_DIR) = original_paths
+        reset_clients()
+        server.stop()
+
+# Verificação do modo em lote: python -m utils.mock_api_server
+if __name__ == "__main__":
+    success, message = check_batch_backfill()
+    print(("OK: " if success else "FAILED: ") + message)
+    raise SystemExit(0 if success else 1)